@@ -1,11 +1,21 @@
-import pygame
 import gym
 import gym_greedy_snake
+from gym_greedy_snake.envs import GreedySnakeBatchEnv
+from gym_greedy_snake.vec_env import BatchVecEnv, SharedMemoryVecEnv
+from gym_greedy_snake.wrappers.phase_profile import PhaseProfile
+from gym_greedy_snake.training.checkpoint import (
+    AsyncCheckpointCallback, MANIFEST_NAME, load_checkpoint, read_manifest, restore_replay_buffer)
+from gym_greedy_snake.training.expert import prefill_replay_buffer
+from gym_greedy_snake.training.replay_buffer import PackedReplayBuffer, TruncateLastTrajectoryCallback
+from gym_greedy_snake.training.sweep import DEFAULT_CONFIG, dqn_kwargs
 
 from stable_baselines3 import DQN
+from stable_baselines3.common.callbacks import BaseCallback, CallbackList
 from stable_baselines3.common.vec_env.dummy_vec_env import DummyVecEnv
 from stable_baselines3.common.evaluation import evaluate_policy
 
+import argparse
+import json
 import os.path
 
 
@@ -17,10 +27,31 @@ info = None
 
 model_path = "./model/GreddySnake-v0.model"
 model_buffer_path = "./model/GreddySnake-v0.model_buffer"
+packed_buffer_path = "./model/GreddySnake-v0.replay/"
 tensorboard_log_path = "./tensorboard/GreddySnake-v0/"
+checkpoint_path = "./model/checkpoints/"
+total_timesteps = 1e6
+
+
+# 把 PhaseProfile 在回合结束时给出的各阶段耗时写到 TensorBoard
+class PhaseProfileCallback(BaseCallback):
+    def _on_step(self):
+        for info in self.locals["infos"]:
+            phase_profile = info.get("phase_profile")
+            if phase_profile is None:
+                continue
+            for phase, profile in phase_profile.items():
+                name = phase.lstrip("_")
+                self.logger.record("profile/{}_ms".format(name),
+                                   profile["time"] * 1000)
+                if profile["calls"] > 0:
+                    self.logger.record("profile/{}_us_per_call".format(name),
+                                       profile["time"] / profile["calls"] * 1e6)
+        return True
 
 ####### test env ########
 
+# import pygame
 # env = gym.make('GreedySnakeWorld-v0', render_mode="human", render_fps=30)
 
 # observation, info = env.reset()
@@ -59,50 +90,121 @@ tensorboard_log_path = "./tensorboard/GreddySnake-v0/"
 
 ####### learn model ########
 
-env = gym.make('GreedySnakeWorld-v0', render_mode="human",
-               world_size=50, render_fps=120)
-# env = gym.make('GreedySnakeWorld-v0')
-
-# while True:
-model = None
-
-if os.path.exists(model_path):
-    model = DQN.load(model_path)
-    model.load_replay_buffer(model_buffer_path)
-else:
-    model = DQN(
-        "MlpPolicy",
-        env=env,
-        learning_rate=2.3e-3,
-        batch_size=64,
-        buffer_size=100000,
-        learning_starts=1000,
-        gamma=0.99,
-        target_update_interval=10,
-        train_freq=256,
-        gradient_steps=128,
-        exploration_fraction=0.16,
-        exploration_final_eps=0.04,
-        policy_kwargs={"net_arch": [256, 256]},
-        verbose=1,
-        tensorboard_log=tensorboard_log_path,
-        device="cuda",
-    )
-
-model.set_env(env, force_reset=True)
-
-model.learn(total_timesteps=1e6)
-
-model.save(model_path)
-
-model.save_replay_buffer(model_buffer_path)
-
-env.close()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-envs", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--profile", action="store_true",
+                        help="log per-phase step timings of the single env to TensorBoard")
+    parser.add_argument("--checkpoint-freq", type=int, default=10000,
+                        help="steps between background checkpoints")
+    parser.add_argument("--prefill", type=int, default=0,
+                        help="fill the replay buffer with this many BFS expert steps before training")
+    parser.add_argument("--packed-buffer", action="store_true",
+                        help="keep the replay buffer bit-packed in memory-mapped files")
+    parser.add_argument("--buffer-size", type=int, default=100000)
+    parser.add_argument("--config", help="JSON file overriding the DQN hyperparameters, "
+                                         "e.g. a trial's progress.json from the sweep")
+    args = parser.parse_args()
+
+    config = dict(DEFAULT_CONFIG, buffer_size=args.buffer_size)
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+        # 超参数搜索的 progress.json 把超参数放在 "config" 中
+        config.update(overrides.get("config", overrides))
+
+    if args.num_envs == 1:
+        env = gym.make('GreedySnakeWorld-v0', render_mode="human",
+                       world_size=50, render_fps=120, info_level="none")
+        # env = gym.make('GreedySnakeWorld-v0', info_level="none")
+        if args.profile:
+            env = PhaseProfile(env)
+    elif args.workers > 1:
+        # 多进程, 每个进程运行 num_envs / workers 个世界
+        env = SharedMemoryVecEnv(
+            args.num_envs, workers=args.workers, seed=args.seed, world_size=50)
+    else:
+        env = BatchVecEnv(GreedySnakeBatchEnv(
+            num_envs=args.num_envs, world_size=50))
+        env.seed(args.seed)
+
+    # while True:
+    # 检查点比最终模型新说明上一次训练没有完成, 从检查点恢复
+    model = None
+    manifest_path = os.path.join(checkpoint_path, MANIFEST_NAME)
+    if os.path.exists(manifest_path) and (not os.path.exists(model_path) or
+                                          os.path.getmtime(manifest_path) > os.path.getmtime(model_path)):
+        model = load_checkpoint(DQN, checkpoint_path, env=env)
+    resumed = model is not None and model.num_timesteps < total_timesteps
+
+    if model is None and os.path.exists(model_path):
+        model = DQN.load(model_path)
+        # 上一次训练结束时的检查点与最终模型是同一步, 回放缓冲区从它恢复
+        manifest = read_manifest(checkpoint_path)
+        if manifest is not None and manifest["num_timesteps"] == model.num_timesteps:
+            restore_replay_buffer(model.replay_buffer, checkpoint_path, manifest)
+        elif os.path.exists(model_buffer_path):
+            model.load_replay_buffer(model_buffer_path)
+    elif model is None:
+        replay_buffer_kwargs = {}
+        if args.packed_buffer:
+            # 缓冲区保存在 packed_buffer_path, DQN.load 时自动从文件恢复
+            replay_buffer_kwargs = {
+                "replay_buffer_class": PackedReplayBuffer,
+                "replay_buffer_kwargs": {"path": packed_buffer_path},
+            }
+        model = DQN(
+            "MlpPolicy",
+            env=env,
+            verbose=1,
+            tensorboard_log=tensorboard_log_path,
+            device="cuda",
+            **dqn_kwargs(config),
+            **replay_buffer_kwargs,
+        )
+
+    model.set_env(env, force_reset=True)
+
+    if args.prefill > 0 and model.num_timesteps == 0:
+        # 回放缓冲区中已经有专家数据, 不需要先随机走 learning_starts 步再开始训练
+        prefill_replay_buffer(model, args.prefill, world_size=50, seed=args.seed)
+        model.learning_starts = 0
+
+    callbacks = [AsyncCheckpointCallback(args.checkpoint_freq, checkpoint_path),
+                 TruncateLastTrajectoryCallback()]
+    if args.profile:
+        callbacks.append(PhaseProfileCallback())
+
+    # 从没有完成的检查点恢复时只训练剩余的步数, TensorBoard 曲线接着之前的继续;
+    # 否则与之前一样每次运行再训练 total_timesteps 步
+    timesteps = total_timesteps - model.num_timesteps if resumed else total_timesteps
+    model.learn(total_timesteps=timesteps,
+                callback=CallbackList(callbacks), reset_num_timesteps=not resumed)
+
+    # 回放缓冲区已经在最后一个检查点中保存
+    model.save(model_path)
+
+    env.close()
 
 ####### learn model ########
 
 ####### test model########
 
+# 不需要 GPU 的表格 Q-learning 基线:
+# python -m gym_greedy_snake.training.tabular --timesteps 2000000
+
+# 批量评估 (一次 predict 处理所有环境, 输出分数分布和每个回合的结果):
+# python -m gym_greedy_snake.training.evaluate ./model/GreddySnake-v0.model --output-dir ./eval/
+
+# 多进程共用一个批量推理服务 (模型文件更新后自动重新加载):
+# python -m gym_greedy_snake.training.inference_server ./model/GreddySnake-v0.model --workers 8
+
+# 超参数搜索 (每个 CPU 核一个试验, 按检查点分数的中位数提前停止):
+# python -m gym_greedy_snake.training.sweep --search random --trials 24 --timesteps 200000
+# python game.py --config ./sweep/GreddySnake-v0/trial_007/progress.json
+
 # env = gym.make('GreedySnakeWorld-v0', render_mode="human",
 #                world_size=50, render_fps=120)
 # # env = gym.make('GreedySnakeWorld-v0')
@@ -0,0 +1,76 @@
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+# 用法:
+#   python -m gym_greedy_snake.benchmarks.import_time
+#   python -m gym_greedy_snake.benchmarks.import_time --module gym_greedy_snake.vec_env.shm_worker
+
+# 无渲染地导入环境不应该超过这个时间 (秒), 主要开销是 gym 本身
+IMPORT_TIME_BUDGET = 1.0
+# 无渲染的导入路径不应该加载这些模块
+FORBIDDEN_MODULES = ["pygame", "torch", "stable_baselines3"]
+
+# 在新的解释器中执行, 这样每次测量的都是冷导入
+MEASURE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure_import(module, runs=5):
+    times = []
+    modules = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", MEASURE_SCRIPT.format(module=module)],
+            check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        times.append(result["time"])
+        modules.update(result["modules"])
+    return float(np.median(times)), modules
+
+
+def check_import_budget(module="gym_greedy_snake.envs", budget=IMPORT_TIME_BUDGET, runs=5):
+    # 返回问题列表, 为空表示在预算之内且没有加载多余的模块
+    import_time, modules = measure_import(module, runs)
+    problems = []
+    if import_time > budget:
+        problems.append("importing {} took {:.3f}s, budget is {:.3f}s".format(
+            module, import_time, budget))
+    for name in FORBIDDEN_MODULES:
+        if name in modules:
+            problems.append("importing {} loaded {}".format(module, name))
+    return import_time, problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", nargs="+", default=[
+        "gym_greedy_snake.envs",
+        "gym_greedy_snake.vec_env",
+        "gym_greedy_snake.vec_env.shm_worker",
+    ])
+    parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module:
+        import_time, problems = check_import_budget(module, args.budget, args.runs)
+        print("{:<40} {:>8.3f}s".format(module, import_time))
+        for problem in problems:
+            print("  " + problem)
+        failed = failed or bool(problems)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import gc
+import tracemalloc
+
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
+from gym_greedy_snake.envs.greedy_snake_world import START_TEMPLATES, GreedySnakeWorldEnv
+
+# 用法: python -m gym_greedy_snake.benchmarks.memory --world-sizes 30 100 1000 3000
+
+MODES = ["dense", "sparse", "batch"]
+
+
+def make_envs(mode, world_size, count):
+    if mode == "batch":
+        env = GreedySnakeBatchEnv(count, world_size=world_size)
+        env.reset(seed=0)
+        env.step(np.zeros(count, dtype=np.int64))
+        return [env]
+    envs = []
+    for i in range(count):
+        env = GreedySnakeWorldEnv(world_size=world_size, info_level="none",
+                                  sparse=mode == "sparse")
+        env.reset(seed=i)
+        env.step(0)
+        envs.append(env)
+    return envs
+
+
+def measure(mode, world_size, count):
+    # 返回 (每个环境的字节数, 所有环境共享的字节数).
+    # 第一个环境还会创建缓存的开局模板, 之后 count 个环境的平均增量才是每个环境的开销
+    START_TEMPLATES.pop(world_size, None)
+    gc.collect()
+    tracemalloc.start()
+    first = make_envs(mode, world_size, 1)
+    first_bytes = tracemalloc.get_traced_memory()[0]
+    envs = make_envs(mode, world_size, count)
+    total_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del first, envs
+    # 批量环境是一个包含 count 个世界的环境, 同样按世界数平均
+    per_env = (total_bytes - first_bytes) / count
+    return per_env, max(first_bytes - per_env, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--world-sizes", type=int, nargs="+", default=[10, 30, 100, 300, 1000])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--count", type=int, default=8, help="envs created per measurement")
+    args = parser.parse_args()
+
+    print("{:<8} {:>10} {:>16} {:>16}".format("mode", "world", "bytes/env", "shared bytes"))
+    for world_size in args.world_sizes:
+        for mode in args.modes:
+            per_env, shared = measure(mode, world_size, args.count)
+            print("{:<8} {:>10} {:>16,.0f} {:>16,.0f}".format(mode, world_size, per_env, shared))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+from collections import deque
+import time
+
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_world import (
+    GreedySnakeWorldEnv,
+    RUNNING,
+    SNAKE_HEAD, SNAKE_BODY,
+    RIGHT_OF_DIRECTION, LEFT_OF_DIRECTION,
+)
+
+# 用法: python -m gym_greedy_snake.benchmarks.step_length --world-size 50
+
+
+def force_snake(env, length):
+    # 按蛇形路线铺出指定长度的蛇, 蛇头在路线末端, 前方是空地
+    path = []
+    for x in range(1, env.world_size - 1):
+        ys = range(1, env.world_size - 1)
+        path.extend((x, y) for y in (ys if x % 2 else reversed(ys)))
+    assert 2 <= length < len(path), "snake length does not fit in the world"
+
+    env._init_world()
+    cells = [x * env.world_size + y for x, y in reversed(path[:length])]
+    for cell in cells[1:]:
+        env.world_flat[cell] = SNAKE_BODY
+    env.world_flat[cells[0]] = SNAKE_HEAD
+    env._init_free_cells()
+    env.snake_cells = deque(cells)
+    env.snake_direction = env.direction_offset.index(cells[0] - cells[1])
+    env._create_food()
+
+
+def survival_action(observation):
+    # 优先直走, 否则右转, 再否则左转
+    direction = int(np.argmax(observation[3:7]))
+    if not observation[0]:
+        return direction
+    if not observation[1]:
+        return RIGHT_OF_DIRECTION[direction]
+    return LEFT_OF_DIRECTION[direction]
+
+
+def benchmark_length(env, length, steps):
+    # 只统计移动和观测的耗时, 不包含 info 的构建
+    env.reset(seed=0)
+    force_snake(env, length)
+    observation = env._get_obs()
+    step_times = np.empty(steps)
+    for i in range(steps):
+        action = survival_action(observation)
+        start = time.perf_counter()
+        env._move_snake(action)
+        observation = env._get_obs()
+        step_times[i] = time.perf_counter() - start
+        if env.world_state != RUNNING:
+            env.reset()
+            force_snake(env, length)
+            observation = env._get_obs()
+    return step_times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--world-size", type=int, default=50)
+    parser.add_argument("--lengths", type=int, nargs="+",
+                        default=[4, 100, 500, 1000, 2000])
+    parser.add_argument("--steps", type=int, default=2000)
+    args = parser.parse_args()
+
+    env = GreedySnakeWorldEnv(world_size=args.world_size)
+    print("{:>8} {:>12} {:>12}".format("length", "mean(us)", "p99(us)"))
+    for length in args.lengths:
+        step_times = benchmark_length(env, length, args.steps) * 1e6
+        print("{:>8} {:>12.1f} {:>12.1f}".format(
+            length, step_times.mean(), np.percentile(step_times, 99)))
+    env.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from gym_greedy_snake.benchmarks.step_length import force_snake, survival_action
+from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
+from gym_greedy_snake.envs.greedy_snake_world import GreedySnakeWorldEnv
+
+# 用法:
+#   python -m gym_greedy_snake.benchmarks.throughput --output baseline.json
+#   python -m gym_greedy_snake.benchmarks.throughput --compare baseline.json
+
+ENV_KINDS = ["single", "batch", "shm"]
+POLICIES = ["random", "scripted"]
+RENDER_MODES = ["none", "rgb_array"]
+
+
+def case_name(env_kind, world_size, length, render_mode, policy):
+    return "{}/ws{}/len{}/{}/{}".format(env_kind, world_size, length, render_mode, policy)
+
+
+def iter_cases(args):
+    for env_kind, world_size, length, render_mode, policy in itertools.product(
+            args.envs, args.world_sizes, args.lengths, args.render_modes, args.policies):
+        # 只有单个环境支持渲染和指定蛇的长度
+        if env_kind != "single" and (render_mode != "none" or length != 4):
+            continue
+        if length != 4 and length >= (world_size - 2) ** 2:
+            continue
+        yield env_kind, world_size, length, render_mode, policy
+
+
+def summarize(step_times, env_steps, reset_times, resets):
+    step_times = np.asarray(step_times)
+    return {
+        "steps_per_sec": env_steps / step_times.sum(),
+        "resets_per_sec": resets / np.sum(reset_times),
+        "p50_us": float(np.percentile(step_times, 50) * 1e6),
+        "p99_us": float(np.percentile(step_times, 99) * 1e6),
+    }
+
+
+def benchmark_single(world_size, length, render_mode, policy, steps, resets, seed):
+    env = GreedySnakeWorldEnv(
+        render_mode=None if render_mode == "none" else render_mode,
+        world_size=world_size, info_level="none")
+    rng = np.random.default_rng(seed)
+
+    reset_times = np.empty(resets)
+    for i in range(resets):
+        start = time.perf_counter()
+        env.reset(seed=seed + i)
+        reset_times[i] = time.perf_counter() - start
+
+    observation, _ = env.reset(seed=seed)
+    if length != 4:
+        force_snake(env, length)
+        observation = env._get_obs()
+    step_times = np.empty(steps)
+    for i in range(steps):
+        if policy == "random":
+            action = int(rng.integers(4))
+        else:
+            action = survival_action(observation)
+        start = time.perf_counter()
+        observation, _, terminated, _, _ = env.step(action)
+        if render_mode == "rgb_array":
+            env.render()
+        step_times[i] = time.perf_counter() - start
+        if terminated:
+            observation, _ = env.reset()
+            if length != 4:
+                force_snake(env, length)
+                observation = env._get_obs()
+    env.close()
+    return summarize(step_times, steps, reset_times, resets)
+
+
+def benchmark_vector(env_kind, world_size, policy, steps, resets, seed, num_envs, workers):
+    if env_kind == "batch":
+        env = GreedySnakeBatchEnv(num_envs, world_size=world_size)
+
+        def reset(reset_seed):
+            return env.reset(seed=reset_seed)[0]
+
+        def step(actions):
+            return env.step(actions)[0]
+    else:
+        from gym_greedy_snake.vec_env.shm_vec_env import SharedMemoryVecEnv
+
+        env = SharedMemoryVecEnv(num_envs, workers=workers, world_size=world_size)
+
+        def reset(reset_seed):
+            env.seed(reset_seed)
+            return env.reset()
+
+        def step(actions):
+            return env.step(actions)[0]
+
+    rng = np.random.default_rng(seed)
+    reset_times = np.empty(resets)
+    for i in range(resets):
+        start = time.perf_counter()
+        reset(seed + i)
+        reset_times[i] = time.perf_counter() - start
+
+    observation = reset(seed)
+    step_times = np.empty(steps)
+    for i in range(steps):
+        if policy == "random":
+            actions = rng.integers(0, 4, num_envs)
+        else:
+            actions = np.array([survival_action(o) for o in observation])
+        start = time.perf_counter()
+        observation = step(actions)
+        step_times[i] = time.perf_counter() - start
+    env.close()
+    # 每次 step 推进 num_envs 个世界
+    return summarize(step_times, steps * num_envs, reset_times, resets * num_envs)
+
+
+def run(args):
+    results = {}
+    for env_kind, world_size, length, render_mode, policy in iter_cases(args):
+        name = case_name(env_kind, world_size, length, render_mode, policy)
+        if env_kind == "single":
+            result = benchmark_single(
+                world_size, length, render_mode, policy, args.steps, args.resets, args.seed)
+        else:
+            result = benchmark_vector(
+                env_kind, world_size, policy, max(1, args.steps // args.num_envs),
+                args.resets, args.seed, args.num_envs, args.workers)
+        results[name] = result
+        print("{:<40} {:>12.0f} steps/s {:>10.0f} resets/s {:>9.1f} p50(us) {:>9.1f} p99(us)".format(
+            name, result["steps_per_sec"], result["resets_per_sec"], result["p50_us"], result["p99_us"]))
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "steps": args.steps,
+            "num_envs": args.num_envs,
+            "workers": args.workers,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    # 返回比基线慢超过 threshold 的用例
+    regressions = []
+    print("{:<40} {:>14} {:>14} {:>8}".format("case", "baseline", "current", "ratio"))
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        baseline_speed = baseline["results"][name]["steps_per_sec"]
+        ratio = result["steps_per_sec"] / baseline_speed
+        flag = ""
+        if ratio < 1 - threshold:
+            regressions.append(name)
+            flag = "SLOWER"
+        print("{:<40} {:>14.0f} {:>14.0f} {:>8.2f} {}".format(
+            name, baseline_speed, result["steps_per_sec"], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--envs", nargs="+", choices=ENV_KINDS, default=["single", "batch"])
+    parser.add_argument("--world-sizes", type=int, nargs="+", default=[10, 30, 50, 100, 200])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[4, 500])
+    parser.add_argument("--render-modes", nargs="+", choices=RENDER_MODES, default=RENDER_MODES)
+    parser.add_argument("--policies", nargs="+", choices=POLICIES, default=POLICIES)
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--resets", type=int, default=200)
+    parser.add_argument("--num-envs", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="flag cases more than this fraction slower than the baseline")
+    args = parser.parse_args()
+
+    current = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print("{} case(s) slower than baseline".format(len(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
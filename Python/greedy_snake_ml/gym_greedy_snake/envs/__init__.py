@@ -1 +1,2 @@
 from gym_greedy_snake.envs.greedy_snake_world import GreedySnakeWorldEnv
+from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
@@ -0,0 +1,284 @@
+from gym import spaces
+from gym.utils import seeding
+from gym.vector import VectorEnv
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_world import (
+    RUNNING, WIN, LOSE,
+    UP,
+    ROAD, WALL, FOOD, SNAKE_HEAD, SNAKE_BODY,
+    OPPOSITE_DIRECTION, RIGHT_OF_DIRECTION, LEFT_OF_DIRECTION,
+    OBSERVATION_SPACE_SIZE,
+    WORLD_DTYPE, CELL_DTYPE,
+    start_template,
+)
+
+
+# N 个贪吃蛇世界的批量版本, 规则与 GreedySnakeWorldEnv 完全一致.
+# 所有世界保存在堆叠数组中: 格子为 (N, S, S), 蛇身为环形缓冲区,
+# 位置都用展开后的下标 x * S + y 表示. 结束的世界会在同一次 step 中自动重置,
+# 结束时的观测放在 info["final_observation"] 中.
+class GreedySnakeBatchEnv(VectorEnv):
+
+    metadata = {
+        "render_modes": [],
+        "autoreset": True,
+    }
+
+    def __init__(self, num_envs=1, world_size=30, max_episode_steps=None):
+        super().__init__(
+            num_envs,
+            spaces.Box(0, 1, shape=(OBSERVATION_SPACE_SIZE,), dtype=np.bool_),
+            spaces.Discrete(4),
+        )
+        self.render_mode = None
+
+        self.world_size = world_size
+        self.world_shape = (world_size, world_size)
+        self.world_grid_count = world_size * world_size
+
+        self.loop_frame_count_limit = world_size * 4
+        # 超过这个步数的回合被截断 (truncated), None 表示不限制
+        self.max_episode_steps = max_episode_steps
+
+        # 展开下标下各方向的偏移量, 与 action_to_direction 一致
+        self.direction_offset = np.array(
+            [-1, 1, -world_size, world_size], dtype=np.int64)
+
+        # 与 GreedySnakeWorldEnv 共享的初始世界模板 (已经放好初始的蛇)
+        self.template = start_template(world_size)
+
+        self.env_indices = np.arange(num_envs)
+
+        self.world = np.zeros((num_envs,) + self.world_shape, dtype=WORLD_DTYPE)
+        self.world_flat = self.world.reshape(num_envs, self.world_grid_count)
+        # 蛇身环形缓冲区, snake_head_index 指向蛇头
+        self.snake_body = np.zeros(
+            (num_envs, self.world_grid_count), dtype=CELL_DTYPE)
+        self.snake_head_index = np.zeros(num_envs, dtype=np.int64)
+        self.snake_length = np.zeros(num_envs, dtype=np.int64)
+        self.snake_direction = np.zeros(num_envs, dtype=np.int64)
+        self.food_location = np.zeros(num_envs, dtype=CELL_DTYPE)
+        self.score = np.zeros(num_envs, dtype=np.int64)
+        self.frame_index = np.zeros(num_envs, dtype=np.int64)
+        self.loop_frame_count = np.zeros(num_envs, dtype=np.int64)
+        self.world_state = np.full(num_envs, RUNNING, dtype=np.int64)
+        self.episode_steps = np.zeros(num_envs, dtype=np.int64)
+        # 每个世界的空地集合, 维护方式与 GreedySnakeWorldEnv 相同
+        self.free_cells = np.zeros(
+            (num_envs, self.world_grid_count), dtype=CELL_DTYPE)
+        self.free_cell_index = np.full(
+            (num_envs, self.world_grid_count), -1, dtype=CELL_DTYPE)
+        self.free_cell_count = np.zeros(num_envs, dtype=np.int64)
+
+        self.np_randoms = [None] * num_envs
+        self.actions = None
+
+    def _snake_head(self, indices):
+        return self.snake_body[indices, self.snake_head_index[indices]]
+
+    def _snake_tail(self, indices):
+        tail_index = ((self.snake_head_index[indices] + self.snake_length[indices] - 1)
+                      % self.world_grid_count)
+        return self.snake_body[indices, tail_index]
+
+    def _is_collision(self, locations):
+        # 撞墙, 或者撞到除尾巴以外的身体
+        grid_types = self.world_flat[self.env_indices, locations]
+        return (grid_types == WALL) | (
+            (grid_types == SNAKE_BODY) & (locations != self._snake_tail(self.env_indices)))
+
+    def _get_obs(self):
+        snake_direction = self.snake_direction
+        snake_head_location = self._snake_head(self.env_indices)
+        offset = self.direction_offset
+
+        observation = np.empty(
+            (self.num_envs, OBSERVATION_SPACE_SIZE), dtype=np.bool_)
+        # Danger straight / right / left
+        observation[:, 0] = self._is_collision(
+            snake_head_location + offset[snake_direction])
+        observation[:, 1] = self._is_collision(
+            snake_head_location + offset[RIGHT_OF_DIRECTION[snake_direction]])
+        observation[:, 2] = self._is_collision(
+            snake_head_location + offset[LEFT_OF_DIRECTION[snake_direction]])
+        # Move Dir
+        observation[:, 3:7] = snake_direction[:, None] == np.arange(4)
+        # Food location
+        head_x, head_y = np.divmod(snake_head_location, self.world_size)
+        food_x, food_y = np.divmod(self.food_location, self.world_size)
+        observation[:, 7] = food_x < head_x
+        observation[:, 8] = food_x > head_x
+        observation[:, 9] = food_y < head_y
+        observation[:, 10] = food_y > head_y
+        return observation
+
+    def _get_info(self, index):
+        return {
+            "score": int(self.score[index]),
+            "length": int(self.snake_length[index]),
+            "frame_index": int(self.frame_index[index]),
+        }
+
+    def _add_free_cells(self, indices, cells):
+        counts = self.free_cell_count[indices]
+        self.free_cells[indices, counts] = cells
+        self.free_cell_index[indices, cells] = counts
+        self.free_cell_count[indices] += 1
+
+    def _remove_free_cells(self, indices, cells):
+        # 用最后一个空地填补被移除的位置
+        positions = self.free_cell_index[indices, cells]
+        last_cells = self.free_cells[indices, self.free_cell_count[indices] - 1]
+        self.free_cells[indices, positions] = last_cells
+        self.free_cell_index[indices, last_cells] = positions
+        self.free_cell_index[indices, cells] = -1
+        self.free_cell_count[indices] -= 1
+
+    def _create_food(self, index):
+        # 与 GreedySnakeWorldEnv._create_food 使用相同的随机数
+        free_cell_count = self.free_cell_count[index]
+        if free_cell_count == 0:
+            return False
+        location = self.free_cells[index, self.np_randoms[index].integers(
+            0, free_cell_count)]
+        self.food_location[index] = location
+        self.world_flat[index, location] = FOOD
+        self._remove_free_cells(index, location)
+        return True
+
+    def _reset_worlds(self, indices):
+        template = self.template
+        self.world[indices] = template.world
+        self.snake_body[indices, :4] = template.snake_cells
+        self.snake_head_index[indices] = 0
+        self.snake_length[indices] = 4
+        self.snake_direction[indices] = UP
+        self.food_location[indices] = 0
+        self.score[indices] = 0
+        self.frame_index[indices] = 0
+        self.loop_frame_count[indices] = 0
+        self.world_state[indices] = RUNNING
+        self.episode_steps[indices] = 0
+
+        # 空地集合的顺序与单个环境一致, 相同种子下食物位置也一致
+        self.free_cells[indices] = template.free_cells
+        self.free_cell_index[indices] = template.free_cell_index
+        self.free_cell_count[indices] = template.free_cell_count
+
+        for index in indices:
+            self._create_food(index)
+
+    def reset_wait(self, seed=None, options=None):
+        if seed is None:
+            seed = [None] * self.num_envs
+        elif isinstance(seed, int):
+            seed = [seed + i for i in range(self.num_envs)]
+        assert len(seed) == self.num_envs
+
+        for index, env_seed in enumerate(seed):
+            if env_seed is not None or self.np_randoms[index] is None:
+                self.np_randoms[index], _ = seeding.np_random(env_seed)
+
+        self._reset_worlds(self.env_indices)
+
+        return self._get_obs(), {}
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions, dtype=np.int64)
+
+    def step_wait(self):
+        old_score = self.score.copy()
+
+        self._move_snakes(self.actions)
+
+        observation = self._get_obs()
+        reward = (self.score - old_score).astype(np.float64)
+        terminated = self.world_state != RUNNING
+        self.episode_steps += 1
+        if self.max_episode_steps is None:
+            truncated = np.zeros(self.num_envs, dtype=np.bool_)
+        else:
+            truncated = ~terminated & (self.episode_steps >= self.max_episode_steps)
+        done = terminated | truncated
+        info = {}
+
+        if done.any():
+            done_indices = np.flatnonzero(done)
+            final_observation = np.full(self.num_envs, None, dtype=object)
+            final_info = np.full(self.num_envs, None, dtype=object)
+            for index in done_indices:
+                final_observation[index] = observation[index].copy()
+                final_info[index] = self._get_info(index)
+
+            self._reset_worlds(done_indices)
+            observation = self._get_obs()
+
+            info["final_observation"] = final_observation
+            info["_final_observation"] = done.copy()
+            info["final_info"] = final_info
+            info["_final_info"] = done.copy()
+
+        return observation, reward, terminated, truncated, info
+
+    def _move_snakes(self, actions):
+        # 监测移动方向是否合法
+        indices = np.flatnonzero(
+            (self.world_state == RUNNING)
+            & (actions != OPPOSITE_DIRECTION[self.snake_direction]))
+        actions = actions[indices]
+
+        self.frame_index[indices] += 1
+        # 计算新的蛇头
+        old_snake_head_location = self._snake_head(indices)
+        new_snake_head_location = old_snake_head_location + \
+            self.direction_offset[actions]
+        grid_types = self.world_flat[indices, new_snake_head_location]
+        # 检查是否撞墙或者撞到身体
+        lose = (grid_types == WALL) | (
+            (grid_types == SNAKE_BODY)
+            & (new_snake_head_location != self._snake_tail(indices)))
+        self.world_state[indices[lose]] = LOSE
+
+        alive = ~lose
+        indices = indices[alive]
+        actions = actions[alive]
+        old_snake_head_location = old_snake_head_location[alive]
+        new_snake_head_location = new_snake_head_location[alive]
+        eat = grid_types[alive] == FOOD
+
+        # 这里处理只是移动的情况, 先把尾巴让出来
+        move_indices = indices[~eat]
+        old_snake_tail_location = self._snake_tail(move_indices)
+        self.world_flat[move_indices, old_snake_tail_location] = ROAD
+        self._add_free_cells(move_indices, old_snake_tail_location)
+        self.snake_length[move_indices] -= 1
+
+        self.world_flat[indices, old_snake_head_location] = SNAKE_BODY
+        self.world_flat[indices, new_snake_head_location] = SNAKE_HEAD
+        self._remove_free_cells(
+            move_indices, new_snake_head_location[~eat])
+        self.snake_head_index[indices] = (
+            self.snake_head_index[indices] - 1) % self.world_grid_count
+        self.snake_body[indices,
+                        self.snake_head_index[indices]] = new_snake_head_location
+        self.snake_length[indices] += 1
+        self.snake_direction[indices] = actions
+
+        self.loop_frame_count[move_indices] += 1
+        loop = move_indices[self.loop_frame_count[move_indices]
+                            >= self.loop_frame_count_limit]
+        self.score[loop] -= 1
+        self.loop_frame_count[loop] = 0
+
+        # 检测是否吃到食物
+        eat_indices = indices[eat]
+        self.score[eat_indices] += 1
+        self.loop_frame_count[eat_indices] = 0
+        for index in eat_indices:
+            # 创建食物失败标识地图已经没有可以防止食物的位置
+            if not self._create_food(index):
+                self.world_state[index] = WIN
+
+    def close_extras(self, **kwargs):
+        pass
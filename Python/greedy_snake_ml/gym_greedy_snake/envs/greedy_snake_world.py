@@ -1,6 +1,10 @@
+from collections import deque, namedtuple
+import functools
+import os
+import time
+
 import gym
 from gym import spaces
-import pygame
 import numpy as np
 
 RUNNING = 0
@@ -23,7 +27,303 @@ SNAKE_HEAD = 3
 SNAKE_BODY = 4
 GRID_TYPE_MAX = 5
 
+# 只有 5 种格子, 世界用 uint8 保存; 位置都用展开下标 x * world_size + y 表示,
+# 空地集合和蛇身的下标用 int32 (密集模式下世界最大约 46000 x 46000)
+WORLD_DTYPE = np.uint8
+CELL_DTYPE = np.int32
+
+# 按格子类型索引的颜色
+GRID_COLORS = np.array([
+    (127, 127, 127),  # ROAD
+    (0, 0, 0),  # WALL
+    (255, 0, 0),  # FOOD
+    (0, 0, 255),  # SNAKE_HEAD
+    (0, 255, 0),  # SNAKE_BODY
+], dtype=np.uint8)
+
+# 方向的反方向, 用于判断移动是否合法
+OPPOSITE_DIRECTION = np.array([DOWN, UP, RIGHT, LEFT])
+# 相对当前方向的右转和左转
+RIGHT_OF_DIRECTION = np.array([RIGHT, LEFT, UP, DOWN])
+LEFT_OF_DIRECTION = np.array([LEFT, RIGHT, DOWN, UP])
+
 OBSERVATION_SPACE_SIZE = 11
+# 观测按位打包成 uint16 时每一位的权重
+OBSERVATION_BITS = (1 << np.arange(OBSERVATION_SPACE_SIZE)).astype(np.uint16)
+
+# features: 11 个布尔特征; grid: 整个世界的 (C, S, S) 独热张量;
+# egocentric: 以蛇头为中心 view_size x view_size 的窗口, 世界之外视为墙壁
+OBSERVATION_MODES = ["features", "grid", "egocentric"]
+# 网格观测的通道, 按格子类型 WALL, FOOD, SNAKE_HEAD, SNAKE_BODY 的顺序,
+# body_age=True 时追加一个通道: 蛇身每一格还要多少步才会移走 (尾巴为 1, 最大 255)
+GRID_WALL_CHANNEL = 0
+GRID_FOOD_CHANNEL = 1
+GRID_HEAD_CHANNEL = 2
+GRID_BODY_CHANNEL = 3
+GRID_AGE_CHANNEL = 4
+GRID_ONE_HOT_CHANNELS = 4
+# 按格子类型索引的独热编码, ROAD 全为 0
+GRID_ONE_HOT = np.eye(GRID_TYPE_MAX, dtype=np.uint8)[:, 1:]
+
+INFO_LEVELS = ["none", "summary", "full"]
+
+# 可以统计耗时的阶段, 耗时包含内部调用的其它阶段
+PROFILE_PHASES = ["_move_snake", "_get_obs", "_get_info", "_create_food", "_render_frame"]
+
+
+def _profiled_phase(method):
+    # 开启 profiling (phase_times 不为 None) 时统计方法的耗时和调用次数,
+    # 没有开启时只多一次属性检查
+    phase = method.__name__
+
+    @functools.wraps(method)
+    def profiled_method(self, *args, **kwargs):
+        if self.phase_times is None:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.phase_times[phase] += time.perf_counter() - start
+            self.phase_calls[phase] += 1
+    return profiled_method
+
+
+# info 字典中开销较大的字段只在第一次访问时才构建
+class LazyInfo(dict):
+
+    def __init__(self, factories, **kwargs):
+        super().__init__(**kwargs)
+        self._factories = factories
+
+    def _materialize(self):
+        for key in list(self._factories):
+            self[key]
+
+    def __missing__(self, key):
+        if key not in self._factories:
+            raise KeyError(key)
+        value = self._factories.pop(key)()
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self._factories
+
+    # 修改字典的方法先处理还没有构建的字段: 写入或删除时丢弃它的构建函数, 读取时先构建
+    def __setitem__(self, key, value):
+        self._factories.pop(key, None)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if self._factories.pop(key, None) is None:
+            super().__delitem__(key)
+
+    def pop(self, key, *default):
+        if key in self._factories:
+            return self._factories.pop(key)()
+        return super().pop(key, *default)
+
+    def popitem(self):
+        self._materialize()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        self._factories.clear()
+        super().clear()
+
+    def __iter__(self):
+        self._materialize()
+        return super().__iter__()
+
+    def __len__(self):
+        return super().__len__() + len(self._factories)
+
+    def __eq__(self, other):
+        self._materialize()
+        return super().__eq__(other)
+
+    def __repr__(self):
+        self._materialize()
+        return super().__repr__()
+
+    def __reduce__(self):
+        return dict, (self.copy(),)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        self._materialize()
+        return super().keys()
+
+    def values(self):
+        self._materialize()
+        return super().values()
+
+    def items(self):
+        self._materialize()
+        return super().items()
+
+    def copy(self):
+        self._materialize()
+        return dict(super().items())
+
+
+# clone_state 保存的世界状态, 可以反复用于 restore_state
+GreedySnakeWorldState = namedtuple("GreedySnakeWorldState", [
+    "world",
+    "snake_cells",
+    "snake_direction",
+    "food_cell",
+    "free_cells",
+    "free_cell_index",
+    "free_cell_count",
+    "score",
+    "frame_index",
+    "loop_frame_count",
+    "world_state",
+    "np_random_state",
+])
+
+
+def _import_pygame():
+    # pygame 只在渲染时才导入, 无界面训练时不需要加载它, 也不打印欢迎信息
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+    return pygame
+
+
+def pack_observation(observation):
+    # 把 (..., 11) 的 bool 观测打包成 uint16, 第 i 个特征对应第 i 位
+    return (np.asarray(observation, dtype=np.uint16) @ OBSERVATION_BITS).astype(np.uint16)
+
+
+def unpack_observation(packed):
+    return (np.asarray(packed, dtype=np.uint16)[..., None] & OBSERVATION_BITS) != 0
+
+
+# 按世界大小缓存的初始世界, 每种大小只构造一次, 所有实例共享且只读.
+# walls_* 是只有墙壁的世界, 其余是放好初始蛇之后 (还没有食物) 的世界
+StartTemplate = namedtuple("StartTemplate", [
+    "walls",
+    "walls_free_cells",
+    "walls_free_cell_index",
+    "walls_free_cell_count",
+    "world",
+    "free_cells",
+    "free_cell_index",
+    "free_cell_count",
+    "snake_cells",
+])
+START_TEMPLATES = {}
+
+
+def _remove_free_cells(free_cells, free_cell_index, free_cell_count, cells):
+    # 依次从空地集合中移除 cells, 用最后一个空地填补被移除的位置, 返回剩余空地数量
+    for cell in cells:
+        index = free_cell_index[cell]
+        last_cell = free_cells[free_cell_count - 1]
+        free_cells[index] = last_cell
+        free_cell_index[last_cell] = index
+        free_cell_index[cell] = -1
+        free_cell_count -= 1
+    return free_cell_count
+
+
+def initial_snake_cells(world_size):
+    # 初始蛇头在世界中心向上, 身体向下延伸 3 格
+    world_size_half = int(world_size / 2)
+    snake_head_cell = world_size_half * world_size + world_size_half
+    return tuple(snake_head_cell + i for i in range(4))
+
+
+def start_template(world_size):
+    template = START_TEMPLATES.get(world_size)
+    if template is not None:
+        return template
+
+    world_grid_count = world_size * world_size
+    walls = np.zeros((world_size, world_size), dtype=WORLD_DTYPE)
+    walls[[0, -1], :] = WALL
+    walls[:, [0, -1]] = WALL
+    road_cells = np.flatnonzero(walls.ravel() == ROAD)
+    walls_free_cells = np.zeros(world_grid_count, dtype=CELL_DTYPE)
+    walls_free_cells[:len(road_cells)] = road_cells
+    walls_free_cell_index = np.full(world_grid_count, -1, dtype=CELL_DTYPE)
+    walls_free_cell_index[road_cells] = np.arange(len(road_cells))
+
+    snake_cells = initial_snake_cells(world_size)
+    world = walls.copy()
+    world.ravel()[list(snake_cells[1:])] = SNAKE_BODY
+    world.ravel()[snake_cells[0]] = SNAKE_HEAD
+    free_cells = walls_free_cells.copy()
+    free_cell_index = walls_free_cell_index.copy()
+    free_cell_count = _remove_free_cells(
+        free_cells, free_cell_index, len(road_cells), snake_cells)
+
+    for array in (walls, walls_free_cells, walls_free_cell_index,
+                  world, free_cells, free_cell_index):
+        array.setflags(write=False)
+    template = StartTemplate(
+        walls=walls,
+        walls_free_cells=walls_free_cells,
+        walls_free_cell_index=walls_free_cell_index,
+        walls_free_cell_count=len(road_cells),
+        world=world,
+        free_cells=free_cells,
+        free_cell_index=free_cell_index,
+        free_cell_count=free_cell_count,
+        snake_cells=snake_cells,
+    )
+    START_TEMPLATES[world_size] = template
+    return template
+
+
+# 稀疏模式下的世界: 只保存蛇和食物所在的格子, 墙壁由坐标判断, 其余都是空地.
+# 支持与密集世界展开数组相同的单个下标读写, 内存只与蛇的长度有关
+class SparseGrid:
+
+    def __init__(self, world_size, cells=None):
+        self.world_size = world_size
+        self.cells = {} if cells is None else cells
+
+    def __getitem__(self, cell):
+        grid_type = self.cells.get(cell)
+        if grid_type is not None:
+            return grid_type
+        x, y = divmod(cell, self.world_size)
+        if x == 0 or y == 0 or x == self.world_size - 1 or y == self.world_size - 1:
+            return WALL
+        return ROAD
+
+    def __setitem__(self, cell, grid_type):
+        if grid_type == ROAD:
+            self.cells.pop(cell, None)
+        else:
+            self.cells[cell] = grid_type
+
+    def copy(self):
+        return SparseGrid(self.world_size, dict(self.cells))
+
+    def to_dense(self):
+        world = np.zeros((self.world_size, self.world_size), dtype=WORLD_DTYPE)
+        world[[0, -1], :] = WALL
+        world[:, [0, -1]] = WALL
+        world_flat = world.reshape(-1)
+        for cell, grid_type in self.cells.items():
+            world_flat[cell] = grid_type
+        return world
 
 
 class GreedySnakeWorldEnv(gym.Env):
@@ -33,13 +333,26 @@ class GreedySnakeWorldEnv(gym.Env):
         "render_fps": 4
     }
 
-    def __init__(self, render_mode=None, world_size=30, render_fps=4):
-        self.metadata["render_fps"] = render_fps
+    def __init__(self, render_mode=None, world_size=30, render_fps=4, info_level="full",
+                 render_text=True, render_every=1, copy_observation=True, profile=False,
+                 start_pool_size=0, start_pool_seed=0, sparse=False, observation_mode="features",
+                 body_age=False, view_size=11):
+        # metadata 是类属性, 复制一份避免影响其它实例
+        self.metadata = dict(self.metadata, render_fps=render_fps)
 
         assert render_mode is None or render_mode in self.metadata["render_modes"]
         self.render_mode = render_mode
+        assert info_level in INFO_LEVELS
+        self.info_level = info_level
         self.window = None
         self.clock = None
+        self.font = None
+        self.render_text = render_text
+        self.frame = None
+        # human 模式每 render_every 步才刷新一次窗口
+        self.render_every = render_every
+        self.render_step_count = 0
+        self.rendered_world = None
 
         self.world_size = world_size
         self.world_shape = (world_size, world_size)
@@ -64,180 +377,383 @@ class GreedySnakeWorldEnv(gym.Env):
         #     "snake_head": spaces.Box(0, world_size-1, shape=(2,), dtype=np.int32),
         #     # "snake_tail": spaces.Box(0, world_size-1, shape=(2,), dtype=np.int32),
         # })
-        self.observation_space = spaces.Box(
-            0, 1, shape=(OBSERVATION_SPACE_SIZE,), dtype=np.bool_)
+        assert observation_mode in OBSERVATION_MODES
+        self.observation_mode = observation_mode
+        if observation_mode == "features":
+            self.observation_space = spaces.Box(
+                0, 1, shape=(OBSERVATION_SPACE_SIZE,), dtype=np.bool_)
+        else:
+            self._init_grid_observation(observation_mode, body_age, view_size)
+            assert not sparse, "grid observations need a dense world"
+
+        # 展开下标 x * world_size + y 下各方向的偏移量
+        self.direction_offset = [-1, 1, -world_size, world_size]
+        # 观测写入复用的缓冲区, copy_observation=False 时直接返回缓冲区本身
+        self.observation = np.zeros(OBSERVATION_SPACE_SIZE, dtype=np.bool_)
+        self.copy_observation = copy_observation
+
+        # 世界和空地集合在第一次 reset 时分配, 之后每次 reset 从模板原地复制
+        self.world = None
+        self.free_cells = None
+        self.free_cell_index = None
+        self.free_cell_count = 0
+        # 稀疏模式用于非常大的世界: 不分配 world_size^2 的数组, 只保存墙壁以外的蛇和食物,
+        # 不能渲染, 食物通过随机取格子直到取到空地来放置
+        self.sparse = sparse
+        assert not sparse or render_mode is None, "sparse worlds cannot be rendered"
+        assert sparse or self.world_grid_count < 2 ** 31, "use sparse=True for worlds this large"
+        # start_pool_size > 0 时从预先随机生成的开局中抽取, 而不是固定的初始蛇.
+        # 开局池由 start_pool_seed 决定, 与 reset 的种子和之前的回合无关
+        self.start_pool_size = start_pool_size
+        self.start_pool_seed = start_pool_seed
+        self.start_pool = None
+
+        self.phase_times = None
+        self.phase_calls = None
+        if profile:
+            self.enable_profiling()
+
+    def _init_grid_observation(self, observation_mode, body_age, view_size):
+        # 网格观测保存在一个持久的缓冲区中, 每一步只改写发生变化的几个格子.
+        # 缓冲区四周填充 view_radius 格的墙壁, 以蛇头为中心的窗口直接是缓冲区的切片
+        if observation_mode == "grid":
+            view_size = self.world_size
+            self.view_radius = 0
+        else:
+            assert view_size % 2 == 1, "view_size must be odd"
+            self.view_radius = view_size // 2
+        self.view_size = view_size
+        self.body_age = body_age
+        channels = GRID_ONE_HOT_CHANNELS + int(body_age)
+        high = np.ones((channels, view_size, view_size), dtype=np.uint8)
+        if body_age:
+            high[GRID_AGE_CHANNEL] = 255
+        self.observation_space = spaces.Box(0, high, dtype=np.uint8)
+
+        padded_size = self.world_size + 2 * self.view_radius
+        self.grid_buffer = np.zeros((channels, padded_size, padded_size), dtype=np.uint8)
+        self.grid_buffer[GRID_WALL_CHANNEL] = 1
+        # 蛇头到达每个格子时的 frame_index, 用于计算 body-age 通道
+        self.cell_birth = np.zeros((padded_size, padded_size), dtype=np.int64) if body_age else None
+        # 上一次观测时蛇头, 蛇尾和食物的位置, 为 None 时整个缓冲区需要重建
+        self.grid_cells = None
+
+    def enable_profiling(self):
+        # 计时由类上的 _profiled_phase 完成, 这里只开启统计, 实例上不保存任何闭包,
+        # deepcopy 之后的环境统计自己的耗时
+        if self.phase_times is not None:
+            return
+        self.phase_times = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.phase_calls = dict.fromkeys(PROFILE_PHASES, 0)
+
+    def disable_profiling(self):
+        self.phase_times = None
+        self.phase_calls = None
+
+    def get_profile(self):
+        if self.phase_times is None:
+            return {}
+        return {
+            phase: {"time": self.phase_times[phase], "calls": self.phase_calls[phase]}
+            for phase in PROFILE_PHASES
+        }
 
-    def _is_collision(self, location=None):
-        if location is None:
-            location = self.snake_locations[0]
+    def reset_profile(self):
+        if self.phase_times is None:
+            return
+        for phase in PROFILE_PHASES:
+            self.phase_times[phase] = 0.0
+            self.phase_calls[phase] = 0
+
+    @property
+    def snake_locations(self):
+        # 按 (x, y) 坐标返回蛇身, 第一个是蛇头
+        return [np.array(divmod(cell, self.world_size)) for cell in self.snake_cells]
+
+    @property
+    def food_location(self):
+        return np.array(divmod(self.food_cell, self.world_size))
+
+    def _is_collision_cell(self, cell):
+        grid_type = self.world_flat[cell]
         # 检查是否撞墙
-        if self.world[location[0], location[1]] == WALL:
+        if grid_type == WALL:
             return True
-        # 检查是否撞到身体
-        for i in range(1, len(self.snake_locations) - 1):
-            if np.linalg.norm(location - self.snake_locations[i]) == 0:
-                return True
-
-        return False
+        # 检查是否撞到身体, 尾巴在下一步会移走所以不算
+        return grid_type == SNAKE_BODY and cell != self.snake_cells[-1]
 
+    @_profiled_phase
     def _get_obs(self):
-        # return {
-        #     # "world": self.world.flatten(),
-        #     "food": self.food_location,
-        #     "snake_direction": self.snake_direction,
-        #     "snake_head": np.array(self.snake_locations[0]),
-        #     # "snake_tail": np.array(self.snake_locations[-1]),
-        # }
+        if self.observation_mode != "features":
+            return self._get_grid_obs()
+        observation = self.observation
         snake_direction = self.snake_direction
-        snake_head_location = self.snake_locations[0]
-        food_location = self.food_location
-
-        snake_head_location_up = (
-            snake_head_location + self.action_to_direction[UP])
-        snake_head_location_down = (
-            snake_head_location + self.action_to_direction[DOWN])
-        snake_head_location_left = (
-            snake_head_location + self.action_to_direction[LEFT])
-        snake_head_location_right = (
-            snake_head_location + self.action_to_direction[RIGHT])
-
-        snake_direction_up = all(
-            snake_direction == self.action_to_direction[UP])
-        snake_direction_down = all(
-            snake_direction == self.action_to_direction[DOWN])
-        snake_direction_left = all(
-            snake_direction == self.action_to_direction[LEFT])
-        snake_direction_right = all(
-            snake_direction == self.action_to_direction[RIGHT])
-
-        return [
-            # Danger straight
-            (snake_direction_up and self._is_collision(snake_head_location_up)) or
-            (snake_direction_down and self._is_collision(snake_head_location_down)) or
-            (snake_direction_left and self._is_collision(snake_head_location_left)) or
-            (snake_direction_right and self._is_collision(snake_head_location_right)),
-
-            # Danger right
-            (snake_direction_up and self._is_collision(snake_head_location_right)) or
-            (snake_direction_down and self._is_collision(snake_head_location_left)) or
-            (snake_direction_left and self._is_collision(snake_head_location_up)) or
-            (snake_direction_right and self._is_collision(snake_head_location_down)),
-
-            # Danger left
-            (snake_direction_up and self._is_collision(snake_head_location_left)) or
-            (snake_direction_down and self._is_collision(snake_head_location_right)) or
-            (snake_direction_left and self._is_collision(snake_head_location_down)) or
-            (snake_direction_right and self._is_collision(snake_head_location_up)),
-
-            # Move Dir
-            snake_direction_up,
-            snake_direction_down,
-            snake_direction_left,
-            snake_direction_right,
-
-            # Food location
-            food_location[0] < snake_head_location[0],  # food left
-            food_location[0] > snake_head_location[0],  # food right
-            food_location[1] < snake_head_location[1],  # food up
-            food_location[1] > snake_head_location[1],   # food down
-        ]
-
-    def _get_info(self):
-        return {
-            "world": self.world,
-            "food": self.food_location,
-            "snake": np.array(self.snake_locations),
-            "observation_space": self._get_obs(),
-        }
+        snake_head_cell = self.snake_cells[0]
+        direction_offset = self.direction_offset
+
+        # Danger straight
+        observation[0] = self._is_collision_cell(
+            snake_head_cell + direction_offset[snake_direction])
+        # Danger right
+        observation[1] = self._is_collision_cell(
+            snake_head_cell + direction_offset[RIGHT_OF_DIRECTION[snake_direction]])
+        # Danger left
+        observation[2] = self._is_collision_cell(
+            snake_head_cell + direction_offset[LEFT_OF_DIRECTION[snake_direction]])
+
+        # Move Dir
+        observation[3:7] = False
+        observation[3 + snake_direction] = True
+
+        # Food location
+        head_x, head_y = divmod(snake_head_cell, self.world_size)
+        food_x, food_y = divmod(self.food_cell, self.world_size)
+        observation[7] = food_x < head_x  # food left
+        observation[8] = food_x > head_x  # food right
+        observation[9] = food_y < head_y  # food up
+        observation[10] = food_y > head_y  # food down
+
+        if self.copy_observation:
+            return observation.copy()
+        return observation
+
+    def _rebuild_grid(self):
+        radius = self.view_radius
+        inner = (slice(radius, radius + self.world_size),) * 2
+        self.grid_buffer[(slice(None, GRID_ONE_HOT_CHANNELS),) + inner] = \
+            GRID_ONE_HOT[self.world].transpose(2, 0, 1)
+        if self.body_age:
+            x, y = np.divmod(np.array(self.snake_cells), self.world_size)
+            self.cell_birth[x + radius, y + radius] = self.frame_index - np.arange(len(x))
+
+    def _patch_grid_cell(self, cell):
+        x, y = divmod(cell, self.world_size)
+        radius = self.view_radius
+        self.grid_buffer[:GRID_ONE_HOT_CHANNELS, x + radius, y + radius] = \
+            GRID_ONE_HOT[self.world_flat[cell]]
+
+    def _get_grid_obs(self):
+        snake_cells = self.snake_cells
+        head, tail, food = snake_cells[0], snake_cells[-1], self.food_cell
+        if self.grid_cells is None:
+            self._rebuild_grid()
+        else:
+            # 一步之内只有上一次和这一次的蛇头, 蛇尾, 食物所在的格子会发生变化
+            old_head, old_tail, old_food = self.grid_cells
+            for cell in {old_head, old_tail, old_food, head, tail, food}:
+                self._patch_grid_cell(cell)
+            if self.body_age and head != old_head:
+                x, y = divmod(head, self.world_size)
+                self.cell_birth[x + self.view_radius, y + self.view_radius] = self.frame_index
+        self.grid_cells = (head, tail, food)
+
+        if self.observation_mode == "grid":
+            window = (slice(None), slice(None))
+        else:
+            x, y = divmod(head, self.world_size)
+            window = (slice(x, x + self.view_size), slice(y, y + self.view_size))
+        observation = self.grid_buffer[(slice(None),) + window]
+        if self.body_age:
+            # 第 i 节 (蛇头为 0) 的 birth 为 head_birth - i, 移走前还剩 len - i 步;
+            # 只有这个通道需要按窗口重新计算
+            x, y = divmod(head, self.world_size)
+            head_birth = self.cell_birth[x + self.view_radius, y + self.view_radius]
+            snake = observation[GRID_HEAD_CHANNEL] | observation[GRID_BODY_CHANNEL]
+            age = self.cell_birth[window] - (head_birth - len(snake_cells))
+            observation[GRID_AGE_CHANNEL] = np.minimum(age, 255) * snake
+
+        if self.copy_observation:
+            return observation.copy()
+        return observation
+
+    @_profiled_phase
+    def _get_info(self, observation):
+        if self.info_level == "none":
+            return {}
+        if self.info_level == "summary":
+            return {
+                "score": self.score,
+                "length": len(self.snake_cells),
+                "frame_index": self.frame_index,
+            }
+        # world 和 snake 在第一次访问时才构造, 但依据的蛇身和食物在这里就记下:
+        # 自动重置的包装器 (例如 DummyVecEnv) 在调用者读取 info 之前已经重置了环境
+        snake_cells = tuple(self.snake_cells)
+        food_cell = self.food_cell
+        return LazyInfo(
+            {
+                "world": lambda: self._world_from_cells(snake_cells, food_cell),
+                "snake": lambda: np.stack(np.divmod(np.array(snake_cells), self.world_size), axis=1),
+            },
+            food=self.food_location,
+            observation_space=observation,
+        )
+
+    def _world_from_cells(self, snake_cells, food_cell):
+        # 世界中除了墙壁只有蛇和食物; 获胜时蛇头占据了最后一个食物的位置, 所以先放食物
+        grid = SparseGrid(self.world_size)
+        grid[food_cell] = FOOD
+        for cell in snake_cells[1:]:
+            grid[cell] = SNAKE_BODY
+        grid[snake_cells[0]] = SNAKE_HEAD
+        return grid.to_dense()
 
     def _init_world(self):
-        # 构造一个空的世界
-        self.world = np.zeros(self.world_shape, dtype=np.int32)
-        # 在四周填充墙壁
-        for x in range(0, self.world_size):
-            for y in range(0, self.world_size):
-                if x == 0 or x == self.world_size - 1 or y == 0 or y == self.world_size - 1:
-                    self.world[x, y] = WALL
-
-    def _init_snake(self):
-        world_size_half = int(self.world_size / 2)
-        location = np.array([world_size_half, world_size_half])
-        self.snake_locations = []
-        self.snake_locations.append(location)
-        self.world[location[0], location[1]] = SNAKE_HEAD
-
-        for i in range(0, 3):
-            location = location + self.action_to_direction[DOWN]
-            self.snake_locations.append(location)
-            self.world[location[0], location[1]] = SNAKE_BODY
-        self.snake_direction = self.action_to_direction[UP]
+        if self.sparse:
+            self.world_flat = SparseGrid(self.world_size)
+            return
+        # 从模板复制一个只有墙壁的世界
+        template = start_template(self.world_size)
+        self._copy_world(template.walls, template.walls_free_cells,
+                         template.walls_free_cell_index, template.walls_free_cell_count)
+
+    def _copy_world(self, world, free_cells, free_cell_index, free_cell_count):
+        if self.world is None:
+            self.world = world.copy()
+            self.world_flat = self.world.reshape(-1)
+            self.free_cells = free_cells.copy()
+            self.free_cell_index = free_cell_index.copy()
+        else:
+            # 原地复制, world_flat 等视图保持有效
+            self.world[...] = world
+            self.free_cells[:free_cell_count] = free_cells[:free_cell_count]
+            self.free_cell_index[...] = free_cell_index
+        self.free_cell_count = free_cell_count
+
+    def _init_free_cells(self):
+        # 空地集合: free_cells 的前 free_cell_count 个元素是所有空地的展开下标,
+        # free_cell_index 记录每个格子在 free_cells 中的位置, 不是空地时为 -1
+        free_cells = np.flatnonzero(self.world.ravel() == ROAD)
+        self.free_cell_count = len(free_cells)
+        self.free_cells = np.zeros(self.world_grid_count, dtype=CELL_DTYPE)
+        self.free_cells[:self.free_cell_count] = free_cells
+        self.free_cell_index = np.full(self.world_grid_count, -1, dtype=CELL_DTYPE)
+        self.free_cell_index[free_cells] = np.arange(self.free_cell_count)
+
+    def _add_free_cell(self, cell):
+        if self.sparse:
+            return
+        self.free_cells[self.free_cell_count] = cell
+        self.free_cell_index[cell] = self.free_cell_count
+        self.free_cell_count += 1
 
+    def _remove_free_cell(self, cell):
+        if self.sparse:
+            return
+        # 用最后一个空地填补被移除的位置
+        index = self.free_cell_index[cell]
+        last_cell = self.free_cells[self.free_cell_count - 1]
+        self.free_cells[index] = last_cell
+        self.free_cell_index[last_cell] = index
+        self.free_cell_index[cell] = -1
+        self.free_cell_count -= 1
+
+    def _init_snake(self, snake_cells, snake_direction):
+        # 在只有墙壁的世界中放置蛇, snake_cells 为展开下标, 第一个是蛇头
+        snake_cells = [int(cell) for cell in snake_cells]
+        for cell in snake_cells[1:]:
+            self.world_flat[cell] = SNAKE_BODY
+        self.world_flat[snake_cells[0]] = SNAKE_HEAD
+        if not self.sparse:
+            self.free_cell_count = _remove_free_cells(
+                self.free_cells, self.free_cell_index, self.free_cell_count, snake_cells)
+        self.snake_cells = deque(snake_cells)
+        self.snake_direction = int(snake_direction)
+
+    def _init_start_pool(self):
+        # 用 start_pool_seed 一次性生成 start_pool_size 个开局: 蛇头位置和方向随机,
+        # 身体沿反方向伸直, 蛇头前方至少留一格, 食物在剩余空地中随机
+        size = self.start_pool_size
+        rng = np.random.default_rng(self.start_pool_seed)
+        directions = rng.integers(0, 4, size)
+        vectors = np.array([self.action_to_direction[action] for action in range(4)])[directions]
+        low = 1 + np.maximum(3 * vectors, -vectors)
+        high = self.world_size - 2 - np.maximum(vectors, -3 * vectors)
+        heads = rng.integers(low, high + 1)
+        bodies = heads[:, None, :] - np.arange(4)[None, :, None] * vectors[:, None, :]
+        snakes = bodies[..., 0] * self.world_size + bodies[..., 1]
+
+        def random_cells(count):
+            x, y = rng.integers(1, self.world_size - 1, (2, count))
+            return x * self.world_size + y
+
+        foods = random_cells(size)
+        clash = (foods[:, None] == snakes).any(axis=1)
+        while clash.any():
+            foods[clash] = random_cells(clash.sum())
+            clash = (foods[:, None] == snakes).any(axis=1)
+        self.start_pool = (snakes, directions, foods)
+
+    def _place_food(self, cell):
+        self.food_cell = int(cell)
+        self.world_flat[self.food_cell] = FOOD
+        self._remove_free_cell(self.food_cell)
+
+    @_profiled_phase
     def _create_food(self):
-        count = self.np_random.integers(
-            0, self.world_grid_count, size=1, dtype=np.int32)
-        while_count = 0
+        if self.sparse:
+            return self._create_food_sparse()
+        # 没有空地说明地图已经被蛇填满
+        if self.free_cell_count == 0:
+            return False
+        self._place_food(self.free_cells[self.np_random.integers(0, self.free_cell_count)])
+        return True
+
+    def _create_food_sparse(self):
+        if len(self.snake_cells) >= (self.world_size - 2) ** 2:
+            return False
         while True:
-            x = int(count / self.world_size)
-            y = int(count % self.world_size)
-            if self.world[x, y] == ROAD:
-                self.food_location = np.array([x, y])
-                self.world[x, y] = FOOD
+            x, y = self.np_random.integers(1, self.world_size - 1, 2)
+            cell = int(x) * self.world_size + int(y)
+            if self.world_flat[cell] == ROAD:
+                self._place_food(cell)
                 return True
-            count += 1
-            count %= self.world_grid_count
-            while_count += 1
-
-            if while_count > self.world_grid_count:
-                break
-        return False
 
+    @_profiled_phase
     def _move_snake(self, action):
         if self.world_state != RUNNING:
             return
         # 监测移动方向是否合法
-        old_direction = self.snake_direction
-        new_direction = self.action_to_direction[action]
-        if np.linalg.norm(old_direction + new_direction) == 0:
+        action = int(action)
+        if action == OPPOSITE_DIRECTION[self.snake_direction]:
             return
 
         self.frame_index += 1
+        world_flat = self.world_flat
+        snake_cells = self.snake_cells
         # 计算新的蛇头
-        old_snake_head_location = self.snake_locations[0]
-        new_snake_head_location = old_snake_head_location + new_direction
+        old_snake_head_cell = snake_cells[0]
+        new_snake_head_cell = old_snake_head_cell + self.direction_offset[action]
+        grid_type = world_flat[new_snake_head_cell]
         # 检查是否撞墙
-        if self.world[new_snake_head_location[0], new_snake_head_location[1]] == WALL:
+        if grid_type == WALL:
+            self.world_state = LOSE
+            return
+        # 检查是否撞到身体, 尾巴在这一步会移走所以不算
+        if grid_type == SNAKE_BODY and new_snake_head_cell != snake_cells[-1]:
             self.world_state = LOSE
             return
-        # 检查是否撞到身体
-        for i in range(1, len(self.snake_locations) - 1):
-            if np.linalg.norm(new_snake_head_location - self.snake_locations[i]) == 0:
-                self.world_state = LOSE
-                return
         # 检测是否吃到食物
-        if self.world[new_snake_head_location[0], new_snake_head_location[1]] == FOOD:
+        if grid_type == FOOD:
             self.score += 1
             self.loop_frame_count = 0
-            self.world[old_snake_head_location[0],
-                       old_snake_head_location[1]] = SNAKE_BODY
-            self.world[new_snake_head_location[0],
-                       new_snake_head_location[1]] = SNAKE_HEAD
-            self.snake_locations.insert(0, new_snake_head_location)
-            self.snake_direction = new_direction
+            world_flat[old_snake_head_cell] = SNAKE_BODY
+            world_flat[new_snake_head_cell] = SNAKE_HEAD
+            snake_cells.appendleft(new_snake_head_cell)
+            self.snake_direction = action
             # 创建食物失败标识地图已经没有可以防止食物的位置
             if not self._create_food():
                 self.world_state = WIN
             return
         # 这里处理只是移动的情况
-        old_snake_tail_location = self.snake_locations[-1]
-        self.world[old_snake_tail_location[0],
-                   old_snake_tail_location[1]] = ROAD
-        self.snake_locations.pop()
-        self.world[old_snake_head_location[0],
-                   old_snake_head_location[1]] = SNAKE_BODY
-        self.world[new_snake_head_location[0],
-                   new_snake_head_location[1]] = SNAKE_HEAD
-        self.snake_locations.insert(0, new_snake_head_location)
-        self.snake_direction = new_direction
+        old_snake_tail_cell = snake_cells.pop()
+        world_flat[old_snake_tail_cell] = ROAD
+        self._add_free_cell(old_snake_tail_cell)
+        world_flat[old_snake_head_cell] = SNAKE_BODY
+        world_flat[new_snake_head_cell] = SNAKE_HEAD
+        self._remove_free_cell(new_snake_head_cell)
+        snake_cells.appendleft(new_snake_head_cell)
+        self.snake_direction = action
 
         self.loop_frame_count += 1
         if self.loop_frame_count >= self.loop_frame_count_limit:
@@ -251,32 +767,85 @@ class GreedySnakeWorldEnv(gym.Env):
         self.score = 0
         # 帧数
         self.frame_index = 0
-        # 食物位置
-        self.food_location = np.array([0, 0])
-        # 蛇的位置
-        self.snake_locations = np.array([0, 0])
-        # 蛇当前方向
-        self.snake_direction = self.action_to_direction[UP]
         # 循环帧计数
         self.loop_frame_count = 0
-
-        # 初始化世界
-        self._init_world()
         # 世界状态
         self.world_state = RUNNING
-        # 初始化蛇
-        self._init_snake()
-        # 创建食物
-        self._create_food()
 
+        if self.start_pool_size > 0:
+            # 开局池只在第一次 reset 时生成, 之后 reset 只需用 np_random 抽取一个
+            if self.start_pool is None:
+                self._init_start_pool()
+            snakes, directions, foods = self.start_pool
+            index = self.np_random.integers(0, self.start_pool_size)
+            self._init_world()
+            self._init_snake(snakes[index], directions[index])
+            self._place_food(foods[index])
+        elif self.sparse:
+            self._init_world()
+            self._init_snake(initial_snake_cells(self.world_size), UP)
+            self._create_food()
+        else:
+            # 模板中已经放好了初始的蛇, 只需复制世界再创建食物
+            template = start_template(self.world_size)
+            self._copy_world(template.world, template.free_cells,
+                             template.free_cell_index, template.free_cell_count)
+            self.snake_cells = deque(template.snake_cells)
+            self.snake_direction = UP
+            self._create_food()
+
+        if self.observation_mode != "features":
+            self.grid_cells = None
         observation = self._get_obs()
-        info = self._get_info()
+        info = self._get_info(observation)
 
         if self.render_mode == "human":
             self._render_frame()
 
         return observation, info
 
+    def clone_state(self):
+        if self.sparse:
+            world, free_cells, free_cell_index = self.world_flat.copy(), None, None
+        else:
+            world = self.world.copy()
+            free_cells = self.free_cells[:self.free_cell_count].copy()
+            free_cell_index = self.free_cell_index.copy()
+        return GreedySnakeWorldState(
+            world=world,
+            snake_cells=tuple(self.snake_cells),
+            snake_direction=self.snake_direction,
+            food_cell=self.food_cell,
+            free_cells=free_cells,
+            free_cell_index=free_cell_index,
+            free_cell_count=self.free_cell_count,
+            score=self.score,
+            frame_index=self.frame_index,
+            loop_frame_count=self.loop_frame_count,
+            world_state=self.world_state,
+            np_random_state=self.np_random.bit_generator.state,
+        )
+
+    def restore_state(self, state):
+        if self.sparse:
+            self.world_flat = state.world.copy()
+        else:
+            # 原地写回, world_flat 等视图保持有效
+            self.world[...] = state.world
+            self.free_cells[:state.free_cell_count] = state.free_cells
+            self.free_cell_index[...] = state.free_cell_index
+        self.snake_cells = deque(state.snake_cells)
+        self.snake_direction = state.snake_direction
+        self.food_cell = state.food_cell
+        self.free_cell_count = state.free_cell_count
+        self.score = state.score
+        self.frame_index = state.frame_index
+        self.loop_frame_count = state.loop_frame_count
+        self.world_state = state.world_state
+        self.np_random.bit_generator.state = state.np_random_state
+        if self.observation_mode != "features":
+            self.grid_cells = None
+
     def step(self, action):
         old_score = self.score
 
@@ -286,10 +855,13 @@ class GreedySnakeWorldEnv(gym.Env):
         reward = self.score - old_score
         terminated = self.world_state != RUNNING
         truncated = False
-        info = self._get_info()
+        info = self._get_info(observation)
 
         if self.render_mode == "human":
-            self._render_frame()
+            self.render_step_count += 1
+            if self.render_step_count >= self.render_every:
+                self.render_step_count = 0
+                self._render_frame()
 
         return observation, reward, terminated, truncated, info
 
@@ -297,68 +869,103 @@ class GreedySnakeWorldEnv(gym.Env):
         if self.render_mode == "rgb_array":
             return self._render_frame()
 
+    def _render_rgb_array(self):
+        if self.frame is None:
+            grid_stride = GRID_SIZE + GRID_BORDER
+            self.frame = np.full(
+                (self.window_size + TEXT_HEIGHT, self.window_size, 3), 255, dtype=np.uint8)
+            # 每种格子在一行像素中的样子: GRID_SIZE 个颜色像素加上白色边框
+            self.grid_row_colors = np.full(
+                (GRID_TYPE_MAX, grid_stride, 3), 255, dtype=np.uint8)
+            self.grid_row_colors[:, :GRID_SIZE] = GRID_COLORS[:, None]
+            self.grid_row_colors = self.grid_row_colors.reshape(GRID_TYPE_MAX, -1)
+            # 格子区域看成 (y, 像素行, 整行像素), 每个格子的 GRID_SIZE 行像素相同
+            self.frame_grid = self.frame[
+                TEXT_HEIGHT + GRID_BORDER:TEXT_HEIGHT + GRID_BORDER + self.world_size * grid_stride,
+                GRID_BORDER:,
+            ].reshape(self.world_size, grid_stride, -1)[:, :GRID_SIZE]
+
+        # world 按 [x, y] 存储, 图像按 [y, x] 存储
+        self.frame_grid[...] = self.grid_row_colors[self.world.T].reshape(
+            self.world_size, 1, -1)
+
+        if self.render_text:
+            pygame = _import_pygame()
+            if self.font is None:
+                pygame.font.init()
+                self.font = pygame.font.SysFont(None, 20)
+            text_canvas = pygame.Surface((self.window_size, TEXT_HEIGHT))
+            text_canvas.fill((255, 255, 255))
+            text_score = self.font.render(
+                "Score:{}".format(self.score), True, (0, 0, 0))
+            text_frame_index = self.font.render(
+                "FrameIndex:{}".format(self.frame_index), True, (0, 0, 0))
+            text_canvas.blit(text_score, text_score.get_rect())
+            text_canvas.blit(text_frame_index,
+                             text_frame_index.get_rect(topleft=(0, 20)))
+            self.frame[:TEXT_HEIGHT] = pygame.surfarray.pixels3d(
+                text_canvas).transpose(1, 0, 2)
+
+        return self.frame.copy()
+
+    @_profiled_phase
     def _render_frame(self):
-        if self.window is None and self.render_mode == "human":
+        if self.render_mode == "rgb_array":
+            return self._render_rgb_array()
+
+        pygame = _import_pygame()
+        if self.window is None:
             pygame.init()
             pygame.display.init()
             self.window = pygame.display.set_mode(
                 (self.window_size, self.window_size + TEXT_HEIGHT))
             pygame.display.set_caption("Greedy Snake")
             self.font = pygame.font.SysFont(None, 20)
-        if self.clock is None and self.render_mode == "human":
+            self.grid_colors = [tuple(color) for color in GRID_COLORS.tolist()]
+            self.rendered_world = None
+        if self.clock is None:
             self.clock = pygame.time.Clock()
 
-        canvas = pygame.Surface(
-            (self.window_size, self.window_size + TEXT_HEIGHT))
-        canvas.fill((255, 255, 255))
-
-        for x in range(0, self.world_size):
-            for y in range(0, self.world_size):
-                grid_type = self.world[x, y]
-                color = (255, 255, 255)
-                if grid_type == ROAD:
-                    color = (127, 127, 127)
-                elif grid_type == WALL:
-                    color = (0, 0, 0)
-                elif grid_type == FOOD:
-                    color = (255, 0, 0)
-                elif grid_type == SNAKE_HEAD:
-                    color = (0, 0, 255)
-                elif grid_type == SNAKE_BODY:
-                    color = (0, 255, 0)
-
-                pygame.draw.rect(
-                    canvas,
-                    color,
-                    pygame.Rect(
-                        (GRID_BORDER + x * (GRID_SIZE + GRID_BORDER),
-                         TEXT_HEIGHT + GRID_BORDER + y * (GRID_SIZE + GRID_BORDER)),
-                        (GRID_SIZE, GRID_SIZE),
-                    ),
-                )
+        # 窗口本身就是持久的画布, 只重画和上一次绘制相比发生变化的格子
+        if self.rendered_world is None:
+            self.window.fill((255, 255, 255))
+            self.rendered_world = np.full(self.world_shape, GRID_TYPE_MAX, dtype=self.world.dtype)
+            update_rects = [self.window.get_rect()]
+        else:
+            update_rects = []
+        for x, y in np.argwhere(self.world != self.rendered_world):
+            rect = pygame.Rect(
+                (GRID_BORDER + x * (GRID_SIZE + GRID_BORDER),
+                 TEXT_HEIGHT + GRID_BORDER + y * (GRID_SIZE + GRID_BORDER)),
+                (GRID_SIZE, GRID_SIZE),
+            )
+            self.window.fill(self.grid_colors[self.world[x, y]], rect)
+            update_rects.append(rect)
+        self.rendered_world[...] = self.world
+
+        text_rect = pygame.Rect((0, 0), (self.window_size, TEXT_HEIGHT))
+        self.window.fill((255, 255, 255), text_rect)
         text_score = self.font.render(
             "Score:{}".format(self.score), True, (0, 0, 0))
         text_frame_index = self.font.render(
             "FrameIndex:{}".format(self.frame_index), True, (0, 0, 0))
-        canvas.blit(text_score, text_score.get_rect())
-        canvas.blit(text_frame_index,
-                    text_frame_index.get_rect(topleft=(0, 20)))
+        self.window.blit(text_score, text_score.get_rect())
+        self.window.blit(text_frame_index,
+                         text_frame_index.get_rect(topleft=(0, 20)))
+        update_rects.append(text_rect)
 
-        if self.render_mode == "human":
-            # The following line copies our drawings from `canvas` to the visible window
-            self.window.blit(canvas, canvas.get_rect())
-            pygame.event.pump()
-            pygame.display.update()
-
-            # We need to ensure that human-rendering occurs at the predefined framerate.
-            # The following line will automatically add a delay to keep the framerate stable.
-            self.clock.tick(self.metadata["render_fps"])
-        else:  # rgb_array
-            return np.transpose(
-                np.array(pygame.surfarray.pixels3d(canvas)), axes=(1, 0, 2)
-            )
+        pygame.event.pump()
+        pygame.display.update(update_rects)
+
+        # We need to ensure that human-rendering occurs at the predefined framerate.
+        # The following line will automatically add a delay to keep the framerate stable.
+        self.clock.tick(self.metadata["render_fps"])
 
     def close(self):
         if self.window is not None:
+            pygame = _import_pygame()
             pygame.display.quit()
             pygame.quit()
+            self.window = None
+            self.clock = None
+            self.rendered_world = None
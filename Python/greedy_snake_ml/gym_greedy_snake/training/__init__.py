@@ -0,0 +1,25 @@
+# 大部分模块依赖 stable-baselines3 (以及 torch), 只有真正用到时才导入
+_EXPORTS = {
+    "AsyncCheckpointCallback": "gym_greedy_snake.training.checkpoint",
+    "load_checkpoint": "gym_greedy_snake.training.checkpoint",
+    "PackedReplayBuffer": "gym_greedy_snake.training.replay_buffer",
+    "TruncateLastTrajectoryCallback": "gym_greedy_snake.training.replay_buffer",
+    "evaluate_model": "gym_greedy_snake.training.evaluate",
+    "evaluate_policy": "gym_greedy_snake.training.evaluate",
+    "TabularQLearner": "gym_greedy_snake.training.tabular",
+    "BFSExpert": "gym_greedy_snake.training.expert",
+    "prefill_replay_buffer": "gym_greedy_snake.training.expert",
+    "InferenceServer": "gym_greedy_snake.training.inference_server",
+    "InferenceClient": "gym_greedy_snake.training.inference_server",
+    "run_trial": "gym_greedy_snake.training.sweep",
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        import importlib
+        return getattr(importlib.import_module(_EXPORTS[name]), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+__all__ = list(_EXPORTS)
@@ -0,0 +1,288 @@
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch as th
+
+import stable_baselines3 as sb3
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.save_util import data_to_json
+from stable_baselines3.common.utils import get_system_info
+
+from gym_greedy_snake.training.replay_buffer import PackedReplayBuffer
+
+# 检查点目录结构:
+#   checkpoint.json         最新的完整检查点, 最后写入, 只有它引用的文件才是有效的
+#   model_<步数>.zip        模型 (压缩的 SB3 zip, DQN.load 可以直接读取)
+#   buffer_<序号>.npz       回放缓冲区的增量块, 只包含上一个检查点之后新增的数据
+# 所有文件先写到 .tmp 再改名, 中途崩溃时旧的检查点仍然完整.
+# PackedReplayBuffer 本身就是磁盘上的映射文件, 检查点只刷新它, 不再写增量块.
+MANIFEST_NAME = "checkpoint.json"
+CHECKPOINT_FILE_PATTERN = re.compile(r"^(model_\d+\.zip|buffer_\d+\.npz)$")
+# 恢复回放缓冲区时每次从增量块中读取的行数
+BUFFER_READ_ROWS = 65536
+REPLAY_BUFFER_ARRAYS = ["observations", "next_observations", "final_observations",
+                        "actions", "rewards", "dones", "timeouts"]
+
+
+def _atomic_write(path, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _to_cpu(value):
+    # 复制一份 state_dict, 训练线程之后的更新不会影响正在写入的检查点
+    if isinstance(value, th.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: _to_cpu(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_cpu(item) for item in value)
+    return value
+
+
+def snapshot_model(model):
+    # 与 BaseAlgorithm.save 保存的内容相同, 只是在调用线程中完成序列化和复制,
+    # 真正的压缩和写文件留给后台线程
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for torch_var in state_dicts_names + torch_variable_names:
+        exclude.add(torch_var.split(".")[0])
+    for param_name in exclude:
+        data.pop(param_name, None)
+
+    pytorch_variables = {}
+    for name in torch_variable_names:
+        attr = model
+        for part in name.split("."):
+            attr = getattr(attr, part)
+        pytorch_variables[name] = _to_cpu(attr)
+
+    return data_to_json(data), _to_cpu(model.get_parameters()), pytorch_variables
+
+
+def write_model(path, snapshot):
+    serialized_data, params, pytorch_variables = snapshot
+
+    def write(f):
+        with zipfile.ZipFile(f, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("data", serialized_data)
+            with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as variables_file:
+                th.save(pytorch_variables, variables_file)
+            for file_name, state_dict in params.items():
+                with archive.open(file_name + ".pth", mode="w", force_zip64=True) as param_file:
+                    th.save(state_dict, param_file)
+            archive.writestr("_stable_baselines3_version", sb3.__version__)
+            archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+
+    _atomic_write(path, write)
+
+
+def read_manifest(save_path):
+    manifest_path = os.path.join(save_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _read_npz_rows(archive, name):
+    # 逐块读取 npz 中的一个数组, 每次最多 BUFFER_READ_ROWS 行, 不需要把整个数组读进内存
+    with archive.open(name + ".npy") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        else:
+            raise ValueError("unsupported .npy version {} in {}".format(version, archive.filename))
+        assert not fortran_order
+        row_shape = shape[1:]
+        row_size = dtype.itemsize * int(np.prod(row_shape, dtype=np.int64))
+        for start in range(0, shape[0], BUFFER_READ_ROWS):
+            count = min(BUFFER_READ_ROWS, shape[0] - start)
+            yield start, np.frombuffer(f.read(count * row_size), dtype=dtype).reshape((count,) + row_shape)
+
+
+def restore_replay_buffer(replay_buffer, save_path, manifest):
+    # 把检查点中的增量块按顺序流式写入 (已经分配好的) 回放缓冲区; 没有缓冲区数据时返回 False
+    buffer_manifest = manifest.get("replay_buffer")
+    if replay_buffer is None or buffer_manifest is None:
+        return False
+    buffer_size = replay_buffer.buffer_size
+    for chunk in buffer_manifest["chunks"]:
+        with zipfile.ZipFile(os.path.join(save_path, chunk["file"])) as archive:
+            for member in archive.namelist():
+                name = member[:-len(".npy")]
+                array = getattr(replay_buffer, name)
+                for offset, rows in _read_npz_rows(archive, name):
+                    array[(chunk["start"] + offset + np.arange(len(rows))) % buffer_size] = rows
+    replay_buffer.pos = buffer_manifest["pos"]
+    replay_buffer.full = buffer_manifest["full"]
+    return True
+
+
+def load_checkpoint(model_class, save_path, env=None, load_replay_buffer=True, **kwargs):
+    # 从最新的完整检查点恢复, 没有检查点时返回 None.
+    # 回放缓冲区逐块流式写入预先分配好的数组, 不需要一次性反序列化整个缓冲区
+    manifest = read_manifest(save_path)
+    if manifest is None:
+        return None
+    model = model_class.load(os.path.join(save_path, manifest["model"]), env=env, **kwargs)
+    if load_replay_buffer:
+        restore_replay_buffer(getattr(model, "replay_buffer", None), save_path, manifest)
+    return model
+
+
+# 每 save_freq 步在后台线程中保存一次检查点.
+# 调用线程只做快照: 序列化模型参数, 复制新增的回放数据; 压缩和写文件都在后台完成.
+# 上一个检查点还没写完时推迟到之后的 step, 不会阻塞训练.
+class AsyncCheckpointCallback(BaseCallback):
+
+    def __init__(self, save_freq, save_path, save_replay_buffer=True, keep_last=2, verbose=0):
+        super().__init__(verbose)
+        self.save_freq = save_freq
+        self.save_path = save_path
+        self.save_replay_buffer = save_replay_buffer
+        self.keep_last = keep_last
+
+        self.executor = None
+        self.pending = None
+        self.last_checkpoint_calls = 0
+        self.models = []
+        self.chunks = []
+        self.chunk_index = 0
+        self.buffer_total = 0
+        self.buffer_pos = 0
+
+    def _init_callback(self):
+        os.makedirs(self.save_path, exist_ok=True)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.last_checkpoint_calls = self.n_calls
+
+        # 模型是从这个目录的最新检查点恢复的, 接着之前的增量块继续保存
+        manifest = read_manifest(self.save_path)
+        if manifest is not None and manifest["num_timesteps"] == self.model.num_timesteps:
+            self.models = manifest["models"]
+            buffer_manifest = manifest.get("replay_buffer")
+            if buffer_manifest is not None:
+                self.chunks = buffer_manifest["chunks"]
+                self.buffer_total = buffer_manifest["total"]
+                self.buffer_pos = buffer_manifest["pos"]
+        if manifest is not None:
+            self.chunk_index = manifest["chunk_index"]
+
+    def _on_step(self):
+        if self.n_calls - self.last_checkpoint_calls >= self.save_freq:
+            if self.pending is None or self.pending.done():
+                self.checkpoint()
+        return True
+
+    def _on_training_end(self):
+        self.wait()
+        self.checkpoint()
+        self.wait()
+
+    def wait(self):
+        if self.pending is not None:
+            # 后台线程中的异常在这里抛出
+            self.pending.result()
+            self.pending = None
+
+    def checkpoint(self):
+        self.wait()
+        model_file = "model_{:09d}.zip".format(self.model.num_timesteps)
+        model_snapshot = snapshot_model(self.model)
+        replay_buffer = getattr(self.model, "replay_buffer", None) if self.save_replay_buffer else None
+        buffer_snapshot = None
+        buffer_flush = None
+        if isinstance(replay_buffer, PackedReplayBuffer):
+            # 映射文件在后台刷新, 清单中不记录增量块
+            buffer_flush = (replay_buffer.pos, replay_buffer.full)
+            replay_buffer = None
+        elif replay_buffer is not None:
+            buffer_snapshot = self._snapshot_replay_buffer()
+
+        self.models = [name for name in self.models if name != model_file] + [model_file]
+        self.models = self.models[-self.keep_last:]
+        manifest = {
+            "model": model_file,
+            "models": list(self.models),
+            "num_timesteps": self.model.num_timesteps,
+            "chunk_index": self.chunk_index,
+        }
+        if replay_buffer is not None:
+            manifest["replay_buffer"] = {
+                "pos": int(replay_buffer.pos),
+                "full": bool(replay_buffer.full),
+                "total": self.buffer_total,
+                "chunks": list(self.chunks),
+            }
+        self.last_checkpoint_calls = self.n_calls
+        self.pending = self.executor.submit(
+            self._write, model_file, model_snapshot, buffer_snapshot, buffer_flush, manifest)
+
+    def _snapshot_replay_buffer(self):
+        replay_buffer = self.model.replay_buffer
+        buffer_size = replay_buffer.buffer_size
+        pos = replay_buffer.pos
+        # 每个 step 最多新增一行, 间隔足够长时无法从 pos 判断新增了多少, 直接保存整个缓冲区
+        if self.n_calls - self.last_checkpoint_calls >= buffer_size - 1 or not self.chunks:
+            if replay_buffer.full:
+                start, count = pos, buffer_size
+            else:
+                start, count = 0, pos
+        else:
+            start, count = self.buffer_pos, (pos - self.buffer_pos) % buffer_size
+        self.buffer_pos = pos
+        if count == 0:
+            return None
+
+        indices = (start + np.arange(count)) % buffer_size
+        arrays = {}
+        for name in REPLAY_BUFFER_ARRAYS:
+            array = getattr(replay_buffer, name, None)
+            if array is not None:
+                arrays[name] = array[indices]
+
+        self.chunk_index += 1
+        self.buffer_total += count
+        chunk = {
+            "file": "buffer_{:06d}.npz".format(self.chunk_index),
+            "start": int(start),
+            "count": int(count),
+            "end": self.buffer_total,
+        }
+        # 已经被完全覆盖的旧块不再需要
+        self.chunks = [c for c in self.chunks if c["end"] > self.buffer_total - buffer_size]
+        self.chunks.append(chunk)
+        return chunk["file"], arrays
+
+    def _write(self, model_file, model_snapshot, buffer_snapshot, buffer_flush, manifest):
+        write_model(os.path.join(self.save_path, model_file), model_snapshot)
+        if buffer_flush is not None:
+            self.model.replay_buffer.flush(*buffer_flush)
+        if buffer_snapshot is not None:
+            chunk_file, arrays = buffer_snapshot
+            _atomic_write(os.path.join(self.save_path, chunk_file),
+                          lambda f: np.savez_compressed(f, **arrays))
+        _atomic_write(os.path.join(self.save_path, MANIFEST_NAME),
+                      lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+        # 删除新的检查点不再引用的文件
+        referenced = set(manifest["models"])
+        referenced.update(chunk["file"] for chunk in manifest.get("replay_buffer", {}).get("chunks", []))
+        for name in os.listdir(self.save_path):
+            if CHECKPOINT_FILE_PATTERN.match(name) and name not in referenced:
+                os.remove(os.path.join(self.save_path, name))
+        if self.verbose >= 1:
+            print("Saved checkpoint {} to {}".format(model_file, self.save_path))
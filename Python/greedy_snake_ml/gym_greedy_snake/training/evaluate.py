@@ -0,0 +1,191 @@
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
+
+# 用法:
+#   python -m gym_greedy_snake.training.evaluate ./model/GreddySnake-v0.model
+#   python -m gym_greedy_snake.training.evaluate ./model/checkpoints/ ./model/a.model --workers 2 --output-dir ./eval/
+
+EPISODE_FIELDS = ["episode", "env", "score", "length", "steps", "win", "truncated"]
+
+
+def load_model(path, algorithm="DQN", device="cpu"):
+    # path 可以是 model.save 保存的文件, 也可以是检查点目录;
+    # algorithm="tabular" 时读取 TabularQLearner 保存的 Q 表
+    if algorithm == "tabular":
+        from gym_greedy_snake.training.tabular import TabularQLearner
+        return TabularQLearner.load(path)
+
+    import stable_baselines3
+    from gym_greedy_snake.training.checkpoint import load_checkpoint
+
+    model_class = getattr(stable_baselines3, algorithm)
+    if os.path.isdir(path):
+        model = load_checkpoint(model_class, path, load_replay_buffer=False, device=device)
+        if model is None:
+            raise FileNotFoundError("no checkpoint in {}".format(path))
+        return model
+    return model_class.load(path, device=device)
+
+
+def evaluate_policy(predict, episodes=100, num_envs=16, world_size=50, max_episode_steps=None,
+                    seed=None):
+    # predict: (num_envs, 11) 的观测 -> (num_envs,) 的动作, 每一步只调用一次.
+    # 每个环境最多统计 ceil(episodes / num_envs) 个回合, 避免短回合占多数
+    if episodes < 1:
+        raise ValueError("episodes must be at least 1, got {}".format(episodes))
+    if max_episode_steps is None:
+        max_episode_steps = world_size * world_size * 4
+    env = GreedySnakeBatchEnv(num_envs, world_size=world_size,
+                              max_episode_steps=max_episode_steps)
+    episode_targets = np.array(
+        [(episodes + i) // num_envs for i in range(num_envs)], dtype=np.int64)
+    episode_counts = np.zeros(num_envs, dtype=np.int64)
+    # 蛇占满世界内部时获胜
+    win_length = (world_size - 2) ** 2
+
+    results = []
+    observation, _ = env.reset(seed=seed)
+    steps = 0
+    start = time.perf_counter()
+    while (episode_counts < episode_targets).any():
+        observation, _, terminated, truncated, info = env.step(predict(observation))
+        steps += num_envs
+        if "final_info" not in info:
+            continue
+        for index in np.flatnonzero(terminated | truncated):
+            if episode_counts[index] >= episode_targets[index]:
+                continue
+            episode_counts[index] += 1
+            final_info = info["final_info"][index]
+            results.append({
+                "episode": len(results),
+                "env": int(index),
+                "score": final_info["score"],
+                "length": final_info["length"],
+                "steps": final_info["frame_index"],
+                "win": final_info["length"] >= win_length,
+                "truncated": bool(truncated[index]),
+            })
+    elapsed = time.perf_counter() - start
+    env.close()
+    return results, summarize(results, steps, elapsed)
+
+
+def summarize(results, steps, elapsed):
+    if not results:
+        raise ValueError("cannot summarize an evaluation without any finished episode")
+    scores = np.array([result["score"] for result in results])
+    lengths = np.array([result["length"] for result in results])
+    values, counts = np.unique(scores, return_counts=True)
+    return {
+        "episodes": len(results),
+        "score_mean": float(scores.mean()),
+        "score_std": float(scores.std()),
+        "score_min": int(scores.min()),
+        "score_max": int(scores.max()),
+        "score_percentiles": {
+            str(q): float(np.percentile(scores, q)) for q in (10, 25, 50, 75, 90)},
+        "score_counts": {str(value): int(count) for value, count in zip(values, counts)},
+        "length_mean": float(lengths.mean()),
+        "win_rate": float(np.mean([result["win"] for result in results])),
+        "truncated_rate": float(np.mean([result["truncated"] for result in results])),
+        "steps_per_sec": steps / elapsed,
+    }
+
+
+def write_results(path, results):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=EPISODE_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def evaluate_model(path, episodes=100, num_envs=16, world_size=50, max_episode_steps=None,
+                   seed=None, deterministic=True, algorithm="DQN", output=None):
+    model = load_model(path, algorithm)
+
+    def predict(observation):
+        action, _ = model.predict(observation, deterministic=deterministic)
+        return action
+
+    results, summary = evaluate_policy(
+        predict, episodes, num_envs, world_size, max_episode_steps, seed)
+    if output is not None:
+        write_results(output, results)
+    return summary
+
+
+def _evaluate_worker(kwargs):
+    # 每个进程评估一个模型, 限制 torch 线程数避免多个进程互相抢占
+    if kwargs["algorithm"] != "tabular":
+        import torch
+        torch.set_num_threads(1)
+    return evaluate_model(**kwargs)
+
+
+def output_name(path):
+    return os.path.basename(os.path.normpath(path)) + ".csv"
+
+
+def print_summary(path, summary):
+    print("{}: {} episodes, score {:.2f} +- {:.2f} (min {}, median {}, max {}), "
+          "length {:.1f}, win rate {:.1%}, {:.0f} steps/s".format(
+              path, summary["episodes"], summary["score_mean"], summary["score_std"],
+              summary["score_min"], summary["score_percentiles"]["50"], summary["score_max"],
+              summary["length_mean"], summary["win_rate"], summary["steps_per_sec"]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("models", nargs="+", help="model files or checkpoint directories")
+    parser.add_argument("--algorithm", default="DQN")
+    parser.add_argument("--episodes", type=int, default=100)
+    parser.add_argument("--num-envs", type=int, default=16)
+    parser.add_argument("--world-size", type=int, default=50)
+    parser.add_argument("--max-episode-steps", type=int, default=None,
+                        help="truncate episodes after this many steps (default 4 * world_size^2)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stochastic", action="store_true",
+                        help="sample actions instead of using the greedy policy")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="evaluate this many models in parallel processes")
+    parser.add_argument("--output-dir", help="write per-episode CSV files and summary.json here")
+    args = parser.parse_args()
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = [{
+        "path": path,
+        "episodes": args.episodes,
+        "num_envs": args.num_envs,
+        "world_size": args.world_size,
+        "max_episode_steps": args.max_episode_steps,
+        "seed": args.seed,
+        "deterministic": not args.stochastic,
+        "algorithm": args.algorithm,
+        "output": os.path.join(args.output_dir, output_name(path)) if args.output_dir else None,
+    } for path in args.models]
+
+    if args.workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(jobs))) as executor:
+            summaries = list(executor.map(_evaluate_worker, jobs))
+    else:
+        summaries = [evaluate_model(**job) for job in jobs]
+
+    for path, summary in zip(args.models, summaries):
+        print_summary(path, summary)
+    if args.output_dir:
+        with open(os.path.join(args.output_dir, "summary.json"), "w") as f:
+            json.dump(dict(zip(args.models, summaries)), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
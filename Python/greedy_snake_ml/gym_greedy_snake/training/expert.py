@@ -0,0 +1,165 @@
+import argparse
+import time
+
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
+from gym_greedy_snake.envs.greedy_snake_world import (
+    WALL, SNAKE_HEAD, SNAKE_BODY,
+    OPPOSITE_DIRECTION,
+)
+
+# 用法:
+#   python -m gym_greedy_snake.training.expert --world-size 50 --steps 20000
+
+UNREACHABLE = np.iinfo(np.int64).max
+
+
+# 读取世界状态的专家策略: 沿着从食物出发的 BFS 距离场走向食物,
+# 走不到食物时追着自己的尾巴走, 保证还有出路.
+# 距离场计算时把蛇身当作障碍, 蛇沿着距离场前进时前方的格子不会被占用,
+# 所以只有食物移动或者蛇偏离了距离场 (身体的变化不在预期内) 时才需要重新计算.
+class BFSExpert:
+
+    def __init__(self, world_size):
+        self.world_size = world_size
+        self.direction_offset = np.array([-1, 1, -world_size, world_size], dtype=np.int64)
+        self.distance = None
+        self.food_cell = None
+        # 按距离场移动后预期的蛇头位置, 不一致时说明缓存失效
+        self.expected_head = None
+        self.bfs_count = 0
+
+    def _distance_field(self, world_flat, source):
+        blocked = (world_flat == WALL) | (world_flat == SNAKE_BODY) | (world_flat == SNAKE_HEAD)
+        distance = np.full(world_flat.size, UNREACHABLE, dtype=np.int64)
+        distance[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        step = 0
+        # 四周都是墙, 从内部出发的邻居下标不会越界
+        while len(frontier):
+            step += 1
+            neighbors = (frontier[:, None] + self.direction_offset).ravel()
+            neighbors = np.unique(neighbors[~blocked[neighbors]
+                                            & (distance[neighbors] == UNREACHABLE)])
+            distance[neighbors] = step
+            frontier = neighbors
+        self.bfs_count += 1
+        return distance
+
+    def act(self, world_flat, head, tail, direction, food):
+        # 所有位置都是展开下标 x * world_size + y, 返回动作 (UP/DOWN/LEFT/RIGHT)
+        if food != self.food_cell or head != self.expected_head:
+            self.distance = self._distance_field(world_flat, food)
+            self.food_cell = food
+
+        candidates = []
+        for action in range(4):
+            if action == OPPOSITE_DIRECTION[direction]:
+                continue
+            cell = head + self.direction_offset[action]
+            grid_type = world_flat[cell]
+            # 撞墙或者撞到除尾巴以外的身体
+            if grid_type == WALL or (grid_type == SNAKE_BODY and cell != tail):
+                continue
+            candidates.append((action, cell))
+
+        reachable = [(self.distance[cell], action, cell) for action, cell in candidates
+                     if self.distance[cell] != UNREACHABLE]
+        if reachable:
+            _, action, cell = min(reachable)
+            self.expected_head = cell
+            return action
+
+        # 找不到去食物的路: 选一个能回到尾巴且离尾巴最远的方向, 尽量留出空间
+        self.expected_head = None
+        tail_distance = self._distance_field(world_flat, tail)
+        reachable = [(tail_distance[cell], action) for action, cell in candidates
+                     if tail_distance[cell] != UNREACHABLE]
+        if reachable:
+            return max(reachable)[1]
+        if candidates:
+            return candidates[0][0]
+        return direction
+
+    def act_env(self, env):
+        # 用于 GreedySnakeWorldEnv
+        env = env.unwrapped
+        return self.act(env.world_flat, env.snake_cells[0], env.snake_cells[-1],
+                        env.snake_direction, env.food_cell)
+
+
+def expert_actions(env, experts):
+    # 为 GreedySnakeBatchEnv 的每个世界计算专家动作, 每个世界使用自己的 BFSExpert
+    heads = env._snake_head(env.env_indices).tolist()
+    tails = env._snake_tail(env.env_indices).tolist()
+    directions = env.snake_direction.tolist()
+    foods = env.food_location.tolist()
+    return np.array([
+        expert.act(env.world_flat[index], heads[index], tails[index],
+                   directions[index], foods[index])
+        for index, expert in enumerate(experts)
+    ], dtype=np.int64)
+
+
+def prefill_replay_buffer(model, steps, world_size=50, exploration=0.1, seed=None):
+    # 用专家策略产生 steps 步转移写入 model 的回放缓冲区, 环境数与缓冲区一致.
+    # exploration 比例的动作随机选取, 让缓冲区中也有非专家动作的结果
+    replay_buffer = model.replay_buffer
+    num_envs = replay_buffer.n_envs
+    env = GreedySnakeBatchEnv(num_envs, world_size=world_size)
+    experts = [BFSExpert(world_size) for _ in range(num_envs)]
+    rng = np.random.default_rng(seed)
+
+    observation, _ = env.reset(seed=seed)
+    for _ in range(steps):
+        actions = expert_actions(env, experts)
+        explore = rng.random(num_envs) < exploration
+        actions[explore] = rng.integers(0, 4, explore.sum())
+        next_observation, reward, terminated, truncated, info = env.step(actions)
+
+        dones = terminated | truncated
+        real_next_observation = next_observation.copy()
+        infos = [{} for _ in range(num_envs)]
+        for index in np.flatnonzero(dones):
+            real_next_observation[index] = info["final_observation"][index]
+            infos[index]["TimeLimit.truncated"] = bool(truncated[index] and not terminated[index])
+        replay_buffer.add(observation, real_next_observation, actions,
+                          reward.astype(np.float32), dones, infos)
+        observation = next_observation
+    env.close()
+    # 训练开始时环境会重新 reset, 预填充的最后一个回合在这里结束
+    # (PackedReplayBuffer 把下一个观测保存在下一个位置, 否则会被覆盖)
+    truncate_last_trajectory = getattr(replay_buffer, "truncate_last_trajectory", None)
+    if truncate_last_trajectory is not None:
+        truncate_last_trajectory()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--world-size", type=int, default=50)
+    parser.add_argument("--num-envs", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    env = GreedySnakeBatchEnv(args.num_envs, world_size=args.world_size)
+    experts = [BFSExpert(args.world_size) for _ in range(args.num_envs)]
+    env.reset(seed=args.seed)
+    scores = []
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        _, _, terminated, truncated, info = env.step(expert_actions(env, experts))
+        for index in np.flatnonzero(terminated | truncated):
+            scores.append(info["final_info"][index]["score"])
+    elapsed = time.perf_counter() - start
+    steps = args.steps * args.num_envs
+    bfs_count = sum(expert.bfs_count for expert in experts)
+    print("{} episodes, mean score {:.1f}, max score {}, {:.0f} steps/s, {:.3f} BFS per step".format(
+        len(scores), np.mean(scores) if scores else float("nan"), max(scores, default=0),
+        steps / elapsed, bfs_count / steps))
+    print("current scores", env.score.tolist())
+
+
+if __name__ == "__main__":
+    main()
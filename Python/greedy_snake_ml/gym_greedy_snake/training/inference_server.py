@@ -0,0 +1,291 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener, wait
+
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_world import (
+    GreedySnakeWorldEnv,
+    OBSERVATION_SPACE_SIZE,
+    pack_observation, unpack_observation,
+)
+from gym_greedy_snake.training.evaluate import load_model
+
+# 用法:
+#   python -m gym_greedy_snake.training.inference_server ./model/GreddySnake-v0.model --workers 8
+#   python -m gym_greedy_snake.training.inference_server ./model/checkpoints/ --workers 8 --local
+#
+# 其它进程中:
+#   client = InferenceClient(address)
+#   action, _ = client.predict(observation)
+
+# 没有请求时每隔这么久检查一次是否需要停止或者重新加载模型
+IDLE_POLL = 0.05
+
+
+def model_version(path):
+    # 模型文件的修改时间和大小, 检查点目录看最后写入的清单; 文件不存在时返回 None
+    if os.path.isdir(path):
+        # checkpoint 依赖 torch, 只在服务进程中导入
+        from gym_greedy_snake.training.checkpoint import MANIFEST_NAME
+        path = os.path.join(path, MANIFEST_NAME)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# 集中的推理服务: 所有环境进程通过本地连接 (Linux 上为 Unix socket, Windows 上为命名管道)
+# 发送观测, 服务按 max_batch_size / timeout 把请求攒成一批, 一次 predict 之后把动作分发回去.
+# 观测按位打包成 uint16 发送, 动作以 uint8 返回, 都不经过 pickle.
+# 模型文件 (或检查点目录) 更新后在后台线程中重新加载, 加载完成后替换, 不会中断服务.
+class InferenceServer:
+
+    def __init__(self, model_path, algorithm="DQN", address=None, max_batch_size=256,
+                 timeout=0.002, reload_interval=1.0, device="cpu", deterministic=True):
+        self.model_path = model_path
+        self.algorithm = algorithm
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self.reload_interval = reload_interval
+        self.device = device
+        self.deterministic = deterministic
+
+        self.model_version = model_version(model_path)
+        self.model = load_model(model_path, algorithm, device)
+        self.reload_count = 0
+        self.loader = ThreadPoolExecutor(max_workers=1)
+        self.pending_load = None
+        self.next_reload_check = time.perf_counter() + reload_interval
+
+        self.listener = Listener(address)
+        self.address = self.listener.address
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.client_connected = threading.Event()
+        self.accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.accept_thread.start()
+
+        self.batch_count = 0
+        self.observation_count = 0
+
+    def _accept_loop(self):
+        while not self.stopped.is_set():
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                return
+            with self.connections_lock:
+                self.connections.append(connection)
+            self.client_connected.set()
+
+    def _drop(self, connection):
+        with self.connections_lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+        connection.close()
+
+    def _collect(self):
+        # 等到第一个请求之后最多再等 timeout 秒; 所有已连接的客户端都在等待结果时立即处理
+        with self.connections_lock:
+            connections = list(self.connections)
+        if not connections:
+            # 没有客户端时等待新的连接, 而不是立即返回空转
+            self.client_connected.wait(IDLE_POLL)
+            self.client_connected.clear()
+            return []
+        ready = wait(connections, timeout=IDLE_POLL)
+        deadline = time.perf_counter() + self.timeout
+        requests = []
+        count = 0
+        while ready:
+            for connection in ready:
+                try:
+                    data = connection.recv_bytes()
+                except (EOFError, OSError):
+                    self._drop(connection)
+                    continue
+                packed = np.frombuffer(data, dtype=np.uint16)
+                requests.append((connection, packed))
+                count += len(packed)
+            remaining = deadline - time.perf_counter()
+            if count >= self.max_batch_size or remaining <= 0:
+                break
+            with self.connections_lock:
+                pending = set(connection for connection, _ in requests)
+                waiting = [connection for connection in self.connections if connection not in pending]
+            if not waiting:
+                break
+            ready = wait(waiting, timeout=remaining)
+        return requests
+
+    def _serve_batch(self, requests):
+        packed = np.concatenate([observations for _, observations in requests])
+        actions, _ = self.model.predict(unpack_observation(packed), deterministic=self.deterministic)
+        actions = np.asarray(actions, dtype=np.uint8).reshape(-1)
+        offset = 0
+        for connection, observations in requests:
+            try:
+                connection.send_bytes(actions[offset:offset + len(observations)].tobytes())
+            except OSError:
+                self._drop(connection)
+            offset += len(observations)
+        self.batch_count += 1
+        self.observation_count += len(packed)
+
+    def _check_reload(self):
+        if self.pending_load is not None and self.pending_load.done():
+            try:
+                version, model = self.pending_load.result()
+            except Exception as error:
+                # 文件可能还在写入, 保留旧模型, 下一次检查时重试
+                print("Failed to reload {}: {}".format(self.model_path, error))
+            else:
+                self.model, self.model_version = model, version
+                self.reload_count += 1
+            self.pending_load = None
+
+        now = time.perf_counter()
+        if self.pending_load is None and now >= self.next_reload_check:
+            self.next_reload_check = now + self.reload_interval
+            version = model_version(self.model_path)
+            if version is not None and version != self.model_version:
+                self.pending_load = self.loader.submit(self._load, version)
+
+    def _load(self, version):
+        return version, load_model(self.model_path, self.algorithm, self.device)
+
+    def serve_forever(self):
+        while not self.stopped.is_set():
+            requests = self._collect()
+            if requests:
+                self._serve_batch(requests)
+            self._check_reload()
+
+    def stop(self):
+        self.stopped.set()
+        self.client_connected.set()
+
+    def close(self):
+        self.stop()
+        self.listener.close()
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.loader.shutdown(wait=False)
+
+
+# 环境进程中使用的客户端, predict 与 stable-baselines3 的接口一致,
+# 只依赖 NumPy, 进程中不需要加载 torch 和模型
+class InferenceClient:
+
+    def __init__(self, address):
+        self.connection = Client(address)
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        observation = np.asarray(observation)
+        packed = pack_observation(observation.reshape(-1, OBSERVATION_SPACE_SIZE))
+        self.connection.send_bytes(packed.tobytes())
+        actions = np.frombuffer(self.connection.recv_bytes(), dtype=np.uint8).astype(np.int64)
+        if observation.ndim == 1:
+            return actions[0], None
+        return actions, None
+
+    def close(self):
+        self.connection.close()
+
+
+def _run_episodes(predict, episodes, world_size, seed):
+    env = GreedySnakeWorldEnv(world_size=world_size, info_level="none")
+    scores = []
+    steps = 0
+    start = time.perf_counter()
+    for episode in range(episodes):
+        observation, _ = env.reset(seed=seed + episode)
+        terminated = truncated = False
+        score = 0
+        # 与 evaluate 相同, 限制回合长度避免策略原地打转
+        for _ in range(world_size * world_size * 4):
+            action, _ = predict(observation, deterministic=True)
+            observation, reward, terminated, truncated, _ = env.step(action)
+            score += reward
+            steps += 1
+            if terminated or truncated:
+                break
+        scores.append(score)
+    env.close()
+    return scores, steps, time.perf_counter() - start
+
+
+def _client_worker(address, episodes, world_size, seed):
+    client = InferenceClient(address)
+    try:
+        return _run_episodes(client.predict, episodes, world_size, seed)
+    finally:
+        client.close()
+
+
+def _local_worker(model_path, algorithm, episodes, world_size, seed):
+    # 对照: 每个进程加载自己的模型, 每一步单独 predict
+    if algorithm != "tabular":
+        import torch
+        torch.set_num_threads(1)
+    model = load_model(model_path, algorithm)
+    return _run_episodes(model.predict, episodes, world_size, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model", help="model file or checkpoint directory")
+    parser.add_argument("--algorithm", default="DQN")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--episodes", type=int, default=4, help="episodes per worker")
+    parser.add_argument("--world-size", type=int, default=30)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=0.002, help="seconds to wait for a fuller batch")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--local", action="store_true",
+                        help="let every worker load its own model instead of using the server")
+    args = parser.parse_args()
+
+    # 环境进程不需要继承服务进程中的 torch 状态
+    context = multiprocessing.get_context("spawn")
+    server = None
+    if args.local:
+        jobs = [(_local_worker, args.model, args.algorithm) for _ in range(args.workers)]
+    else:
+        server = InferenceServer(args.model, args.algorithm, max_batch_size=args.max_batch_size,
+                                 timeout=args.timeout)
+        jobs = [(_client_worker, server.address) for _ in range(args.workers)]
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor:
+        futures = [executor.submit(*job, args.episodes, args.world_size, args.seed + i * args.episodes)
+                   for i, job in enumerate(jobs)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    scores = [score for worker_scores, _, _ in results for score in worker_scores]
+    steps = sum(worker_steps for _, worker_steps, _ in results)
+    print("{} episodes, mean score {:.2f}, {} steps in {:.2f}s, {:.0f} steps/s".format(
+        len(scores), np.mean(scores), steps, elapsed, steps / elapsed))
+    if server is not None:
+        server.stop()
+        server_thread.join()
+        server.close()
+        print("{} batches, mean batch size {:.1f}, {} reloads".format(
+            server.batch_count, server.observation_count / max(server.batch_count, 1),
+            server.reload_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import json
+import os
+
+import numpy as np
+from stable_baselines3.common.buffers import BaseBuffer, ReplayBuffer
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+
+from gym_greedy_snake.envs.greedy_snake_world import (
+    OBSERVATION_SPACE_SIZE,
+    pack_observation, unpack_observation,
+)
+
+# 用法:
+#   DQN("MlpPolicy", env, buffer_size=100_000_000,
+#       replay_buffer_class=PackedReplayBuffer,
+#       replay_buffer_kwargs={"path": "./model/GreddySnake-v0.replay/"})
+#   model.learn(total_timesteps, callback=TruncateLastTrajectoryCallback())
+
+STATE_NAME = "state.json"
+# 每个数组保存为 path 目录下的 <名字>.npy, 形状为 (buffer_size, n_envs)
+PACKED_ARRAYS = [
+    ("observations", np.uint16),
+    ("final_observations", np.uint16),
+    ("actions", np.uint8),
+    ("rewards", np.float32),
+    ("dones", np.bool_),
+    ("timeouts", np.bool_),
+]
+# 每个打包后的观测展开成 float32 特征的查找表, 采样时一次索引完成解包
+UNPACKED_OBSERVATIONS = unpack_observation(
+    np.arange(1 << OBSERVATION_SPACE_SIZE)).astype(np.float32)
+
+
+def _open_array(path, dtype, shape):
+    # .npy 文件头记录了 dtype 和形状; 新建的文件是稀疏文件, 只有写过的部分占用磁盘
+    if os.path.exists(path):
+        array = np.lib.format.open_memmap(path, mode="r+")
+        if array.dtype != dtype or array.shape != shape:
+            raise ValueError("{} has dtype {} and shape {}, expected {} and {}".format(
+                path, array.dtype, array.shape, np.dtype(dtype), shape))
+        return array
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+# 为 GreedySnakeWorldEnv 的 11 个布尔特征定制的回放缓冲区:
+#   - 观测按位打包成 uint16, 每个转移只占 2 字节
+#   - 下一个观测就是下一个位置的观测, 不再单独保存; 只有回合结束的转移
+#     (下一个位置是重置后的观测) 把结束时的观测写到 final_observations
+#   - 所有数组都是 path 目录下内存映射的 .npy 文件, 容量只受磁盘限制,
+#     重新创建 (例如 DQN.load) 时从文件恢复, 不需要 pickle
+# 与 optimize_memory_usage 相同, 最新写入的位置 pos 不会被采样.
+class PackedReplayBuffer(ReplayBuffer):
+
+    def __init__(self, buffer_size, observation_space, action_space, device="auto", n_envs=1,
+                 optimize_memory_usage=False, handle_timeout_termination=True, path=None):
+        # 不调用 ReplayBuffer.__init__, 它会在内存中分配完整的数组
+        BaseBuffer.__init__(self, buffer_size, observation_space, action_space, device, n_envs=n_envs)
+        assert self.obs_shape == (OBSERVATION_SPACE_SIZE,), "only for the 11-feature observation"
+        assert path is not None, "PackedReplayBuffer needs a directory path"
+        self.buffer_size = max(buffer_size // n_envs, 1)
+        self.optimize_memory_usage = True
+        self.handle_timeout_termination = handle_timeout_termination
+        self.path = path
+        self.next_observations = None
+        os.makedirs(path, exist_ok=True)
+        self._open_arrays()
+
+        state_path = os.path.join(path, STATE_NAME)
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            self.pos = state["pos"]
+            self.full = state["full"]
+            self.truncate_last_trajectory()
+
+    def _open_arrays(self):
+        shape = (self.buffer_size, self.n_envs)
+        for name, dtype in PACKED_ARRAYS:
+            setattr(self, name, _open_array(os.path.join(self.path, name + ".npy"), dtype, shape))
+
+    def truncate_last_trajectory(self):
+        # 下一次 add 会用新回合的观测覆盖 pos, 最后一个转移的回合在这里被中断,
+        # 按超时截断处理, 下一个观测移到 final_observations. 已经结束的回合保持原样,
+        # 结束时的观测已经在 final_observations 中. 环境重新 reset 之前 (重新打开缓冲区,
+        # 专家数据预填充之后, 每次 learn 开始时) 都需要调用
+        if self.size() == 0:
+            return
+        last = (self.pos - 1) % self.buffer_size
+        interrupted = ~self.dones[last]
+        self.final_observations[last, interrupted] = self.observations[self.pos, interrupted]
+        self.dones[last, interrupted] = True
+        if self.handle_timeout_termination:
+            self.timeouts[last, interrupted] = True
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        pos = self.pos
+        next_packed = pack_observation(np.asarray(next_obs).reshape(self.n_envs, -1))
+        self.observations[pos] = pack_observation(np.asarray(obs).reshape(self.n_envs, -1))
+        self.observations[(pos + 1) % self.buffer_size] = next_packed
+        done = np.asarray(done, dtype=np.bool_).reshape(self.n_envs)
+        self.final_observations[pos, done] = next_packed[done]
+        self.actions[pos] = np.asarray(action).reshape(self.n_envs)
+        self.rewards[pos] = reward
+        self.dones[pos] = done
+        if self.handle_timeout_termination:
+            self.timeouts[pos] = [info.get("TimeLimit.truncated", False) for info in infos]
+
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def sample(self, batch_size, env=None):
+        # 跳过 pos: 它的观测已经被上一个转移的下一个观测覆盖
+        if self.full:
+            batch_inds = (np.random.randint(1, self.buffer_size, size=batch_size)
+                          + self.pos) % self.buffer_size
+        else:
+            batch_inds = np.random.randint(0, self.pos, size=batch_size)
+        return self._get_samples(batch_inds, env=env)
+
+    def _get_samples(self, batch_inds, env=None):
+        env_indices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        dones = self.dones[batch_inds, env_indices]
+        next_packed = np.where(
+            dones,
+            self.final_observations[batch_inds, env_indices],
+            self.observations[(batch_inds + 1) % self.buffer_size, env_indices],
+        )
+        # 当前和下一个观测一起解包
+        packed = np.stack([self.observations[batch_inds, env_indices], next_packed])
+        observations, next_observations = UNPACKED_OBSERVATIONS[packed]
+
+        data = (
+            self._normalize_obs(observations, env),
+            self.actions[batch_inds, env_indices].reshape(-1, 1).astype(np.int64),
+            self._normalize_obs(next_observations, env),
+            # 超时截断的回合不算真正结束
+            (dones & ~self.timeouts[batch_inds, env_indices]).astype(np.float32).reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, env_indices].reshape(-1, 1), env),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+    def flush(self, pos=None, full=None):
+        # 把映射的数据写回磁盘, 再记录有效范围; pos/full 默认为当前值
+        for name, _ in PACKED_ARRAYS:
+            getattr(self, name).flush()
+        state = {
+            "pos": int(self.pos if pos is None else pos),
+            "full": bool(self.full if full is None else full),
+        }
+        state_path = os.path.join(self.path, STATE_NAME)
+        with open(state_path + ".tmp", "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(state_path + ".tmp", state_path)
+
+    def __getstate__(self):
+        # model.save_replay_buffer 只保存路径和位置, 数据留在映射文件中
+        self.flush()
+        state = self.__dict__.copy()
+        for name, _ in PACKED_ARRAYS:
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open_arrays()
+
+
+# learn 开始时环境会重新 reset, 而 PackedReplayBuffer 的下一个观测保存在下一个位置,
+# 自己设置的 optimize_memory_usage 不会让 stable-baselines3 截断最后一个回合, 由这个回调完成
+class TruncateLastTrajectoryCallback(BaseCallback):
+
+    def _on_training_start(self):
+        replay_buffer = getattr(self.model, "replay_buffer", None)
+        if isinstance(replay_buffer, PackedReplayBuffer):
+            replay_buffer.truncate_last_trajectory()
+
+    def _on_step(self):
+        return True
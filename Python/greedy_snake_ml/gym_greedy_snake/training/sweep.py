@@ -0,0 +1,287 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from gym_greedy_snake.training.evaluate import evaluate_policy
+
+# 用法:
+#   python -m gym_greedy_snake.training.sweep --search random --trials 24 --timesteps 200000
+#   python -m gym_greedy_snake.training.sweep --space ./space.json --search grid --output-dir ./sweep/
+#
+# space.json 中每个超参数可以是候选值的列表 (grid 和 random 都可以使用), 或者是
+# random 搜索的分布: {"log_uniform": [1e-4, 1e-2]}, {"uniform": [0.05, 0.3]}, {"int": [32, 256]}
+#   {"learning_rate": {"log_uniform": [1e-4, 1e-2]}, "net_arch": [[64, 64], [256, 256]]}
+
+# 与 game.py 中的 DQN 设置相同, 搜索空间中没有的超参数使用这里的值
+DEFAULT_CONFIG = {
+    "learning_rate": 2.3e-3,
+    "batch_size": 64,
+    "buffer_size": 100000,
+    "learning_starts": 1000,
+    "gamma": 0.99,
+    "target_update_interval": 10,
+    "train_freq": 256,
+    "gradient_steps": 128,
+    "exploration_fraction": 0.16,
+    "exploration_final_eps": 0.04,
+    "net_arch": [256, 256],
+}
+DEFAULT_SPACE = {
+    "learning_rate": {"log_uniform": [1e-4, 5e-3]},
+    "train_freq": [16, 64, 256],
+    "gradient_steps": [16, 64, 128],
+    "exploration_fraction": {"uniform": [0.05, 0.3]},
+    "net_arch": [[64, 64], [128, 128], [256, 256]],
+}
+SEARCH_MODES = ["grid", "random"]
+DISTRIBUTIONS = ["uniform", "log_uniform", "int"]
+TRIAL_STATUSES = ["completed", "stopped", "failed"]
+PROGRESS_NAME = "progress.json"
+RESULTS_NAME = "results.csv"
+RESULT_FIELDS = ["trial", "seed", "status", "timesteps", "best_score", "final_score",
+                 "checkpoints", "elapsed", "error"]
+
+
+def dqn_kwargs(config):
+    # 搜索空间中的 net_arch 转换成 DQN 的 policy_kwargs
+    kwargs = dict(config)
+    kwargs["policy_kwargs"] = {"net_arch": list(kwargs.pop("net_arch"))}
+    return kwargs
+
+
+def grid_configs(space):
+    for name, values in space.items():
+        if not isinstance(values, list):
+            raise ValueError("grid search needs a list of values for {}".format(name))
+    names = list(space)
+    for values in itertools.product(*(space[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def _sample(name, values, rng):
+    if isinstance(values, list):
+        return values[rng.integers(len(values))]
+    if len(values) != 1 or next(iter(values)) not in DISTRIBUTIONS:
+        raise ValueError("unknown distribution for {}: {}".format(name, values))
+    (distribution, (low, high)), = values.items()
+    if distribution == "uniform":
+        return float(rng.uniform(low, high))
+    if distribution == "log_uniform":
+        return float(math.exp(rng.uniform(math.log(low), math.log(high))))
+    return int(rng.integers(low, high + 1))
+
+
+def random_configs(space, trials, seed=None):
+    rng = np.random.default_rng(seed)
+    for _ in range(trials):
+        yield {name: _sample(name, values, rng) for name, values in space.items()}
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _read_progress(sweep_dir, trials, exclude):
+    # 本次搜索中其它试验已经报告的各个检查点的分数, 包括已经结束的试验;
+    # 目录中之前的搜索留下的试验不参与比较
+    scores = []
+    for name in trials:
+        path = os.path.join(sweep_dir, name, PROGRESS_NAME)
+        if name == exclude or not os.path.exists(path):
+            continue
+        try:
+            with open(path) as f:
+                scores.append(json.load(f)["scores"])
+        except (OSError, ValueError):
+            continue
+    return scores
+
+
+def should_stop(scores, others, min_trials=3, grace_checkpoints=1):
+    # 中位数早停: 在第 k 个检查点, 本试验至今的最好分数低于其它试验在前 k 个检查点
+    # 最好分数的中位数时停止; 参与比较的试验少于 min_trials 个时不停止
+    checkpoint = len(scores)
+    if checkpoint <= grace_checkpoints:
+        return False
+    reference = [max(other[:checkpoint]) for other in others if len(other) >= checkpoint]
+    if len(reference) < min_trials:
+        return False
+    return max(scores) < np.median(reference)
+
+
+def run_trial(trial, config, seed, sweep_dir, tensorboard_dir=None, timesteps=200000,
+              num_envs=8, world_size=20, eval_freq=20000, eval_episodes=32,
+              min_trials=3, grace_checkpoints=1, trials=None):
+    # 在 ProcessPoolExecutor 的进程中运行一个试验, 返回结果表中的一行.
+    # trials 是本次搜索所有试验的名字, 中位数早停只和它们比较
+    import torch
+    from stable_baselines3 import DQN
+    from stable_baselines3.common.callbacks import BaseCallback
+    from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
+    from gym_greedy_snake.vec_env import BatchVecEnv
+
+    # 每个进程只用一个线程, 进程数等于 CPU 核数时互不抢占
+    torch.set_num_threads(1)
+    trial_dir = os.path.join(sweep_dir, trial)
+    os.makedirs(trial_dir, exist_ok=True)
+    progress_path = os.path.join(trial_dir, PROGRESS_NAME)
+    _write_json(progress_path, {"config": config, "seed": seed, "scores": []})
+
+    class MedianStoppingCallback(BaseCallback):
+
+        def __init__(self):
+            super().__init__()
+            self.scores = []
+            self.stopped = False
+            self.next_eval = eval_freq
+
+        def _on_step(self):
+            if self.num_timesteps < self.next_eval:
+                return True
+            self.next_eval += eval_freq
+
+            def predict(observation):
+                action, _ = self.model.predict(observation, deterministic=True)
+                return action
+
+            # 每个检查点用相同的种子评估, 分数只反映策略的变化
+            _, summary = evaluate_policy(predict, eval_episodes, min(eval_episodes, 16),
+                                         world_size, seed=seed)
+            self.scores.append(summary["score_mean"])
+            self.logger.record("sweep/score", summary["score_mean"])
+            _write_json(progress_path, {"config": config, "seed": seed, "scores": self.scores})
+            if should_stop(self.scores, _read_progress(sweep_dir, trials or [], trial),
+                           min_trials, grace_checkpoints):
+                self.stopped = True
+                return False
+            return True
+
+    result = {"trial": trial, "seed": seed, "status": "failed", "timesteps": 0,
+              "best_score": None, "final_score": None, "checkpoints": 0, "error": ""}
+    result.update(config)
+    start = time.perf_counter()
+    callback = MedianStoppingCallback()
+    env = None
+    try:
+        env = BatchVecEnv(GreedySnakeBatchEnv(num_envs=num_envs, world_size=world_size))
+        env.seed(seed)
+        model = DQN(
+            "MlpPolicy",
+            env=env,
+            seed=seed,
+            tensorboard_log=None if tensorboard_dir is None else os.path.join(tensorboard_dir, trial),
+            device="cpu",
+            **dqn_kwargs(dict(DEFAULT_CONFIG, **config)),
+        )
+        model.learn(total_timesteps=timesteps, callback=callback)
+        model.save(os.path.join(trial_dir, "model"))
+        result["status"] = "stopped" if callback.stopped else "completed"
+        result["timesteps"] = model.num_timesteps
+    except Exception:
+        result["error"] = traceback.format_exc().strip().splitlines()[-1]
+    finally:
+        if env is not None:
+            env.close()
+    if callback.scores:
+        result["best_score"] = max(callback.scores)
+        result["final_score"] = callback.scores[-1]
+    result["checkpoints"] = len(callback.scores)
+    result["elapsed"] = round(time.perf_counter() - start, 1)
+    return result
+
+
+def _sort_key(result):
+    return -1e9 if result["best_score"] is None else -result["best_score"]
+
+
+def write_results(path, results, names):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS + names)
+        writer.writeheader()
+        writer.writerows(sorted(results, key=_sort_key))
+
+
+def print_results(results, names):
+    fields = ["trial", "status", "timesteps", "best_score", "final_score"] + names
+    rows = [[str(result.get(field, "")) if not isinstance(result.get(field), float)
+             else "{:.4g}".format(result[field]) for field in fields]
+            for result in sorted(results, key=_sort_key)]
+    widths = [max(len(field), *(len(row[i]) for row in rows)) for i, field in enumerate(fields)]
+    print("  ".join(field.ljust(width) for field, width in zip(fields, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--space", help="JSON file with the search space (default: a built-in space)")
+    parser.add_argument("--search", choices=SEARCH_MODES, default="random")
+    parser.add_argument("--trials", type=int, default=16, help="number of random search trials")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="trials running in parallel (default: CPU count)")
+    parser.add_argument("--timesteps", type=int, default=200000, help="training steps per trial")
+    parser.add_argument("--num-envs", type=int, default=8)
+    parser.add_argument("--world-size", type=int, default=20)
+    parser.add_argument("--eval-freq", type=int, default=20000, help="steps between checkpoints")
+    parser.add_argument("--eval-episodes", type=int, default=32)
+    parser.add_argument("--min-trials", type=int, default=3,
+                        help="other trials needed at a checkpoint before stopping by median")
+    parser.add_argument("--grace-checkpoints", type=int, default=1,
+                        help="never stop a trial at its first checkpoints")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default="./sweep/GreddySnake-v0/")
+    parser.add_argument("--tensorboard-dir", default="./tensorboard/GreddySnake-v0-sweep/")
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    if args.search == "grid":
+        configs = list(grid_configs(space))
+    else:
+        configs = list(random_configs(space, args.trials, args.seed))
+    names = list(space)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "space.json"), "w") as f:
+        json.dump({"search": args.search, "space": space}, f, indent=2)
+    results_path = os.path.join(args.output_dir, RESULTS_NAME)
+    trials = ["trial_{:03d}".format(index) for index in range(len(configs))]
+    # 重复使用输出目录时, 同名试验的旧进度在新的试验开始之前不能参与比较
+    for trial in trials:
+        progress_path = os.path.join(args.output_dir, trial, PROGRESS_NAME)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(configs)))) as executor:
+        futures = [executor.submit(
+            run_trial, trial, config, args.seed + index,
+            args.output_dir, args.tensorboard_dir, args.timesteps, args.num_envs,
+            args.world_size, args.eval_freq, args.eval_episodes, args.min_trials,
+            args.grace_checkpoints, trials) for index, (trial, config) in enumerate(zip(trials, configs))]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            # 每个试验结束就重写结果表, 中途停止时已完成的结果不会丢失
+            write_results(results_path, results, names)
+            print("{} {} after {} steps, best score {}".format(
+                result["trial"], result["status"], result["timesteps"], result["best_score"]))
+
+    print_results(results, names)
+    print("results written to {}".format(results_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
+from gym_greedy_snake.envs.greedy_snake_world import (
+    OBSERVATION_SPACE_SIZE,
+    OPPOSITE_DIRECTION,
+    pack_observation,
+)
+
+# 用法:
+#   python -m gym_greedy_snake.training.tabular --timesteps 2000000 --num-envs 64
+#   python -m gym_greedy_snake.training.evaluate ./model/GreddySnake-v0.qtable --algorithm tabular
+
+STATE_COUNT = 1 << OBSERVATION_SPACE_SIZE
+ACTION_COUNT = 4
+ALGORITHMS = ["q_learning", "sarsa"]
+
+TABULAR_MODEL_PATH = "./model/GreddySnake-v0.qtable"
+
+# 观测的第 3~6 位是蛇的朝向. 往反方向走在环境中不会执行, 状态不变, 在 Q 值为负的
+# 状态中它会被 argmax 选中, 蛇原地不动直到回合被截断, 所以选择动作和估计下一个状态的
+# 价值时都排除它. 每个状态的反方向动作, 没有朝向时为 ACTION_COUNT (不排除任何动作)
+HEADING_BITS = (np.arange(STATE_COUNT)[:, None] >> (3 + np.arange(ACTION_COUNT))) & 1
+REVERSE_ACTIONS = np.where(HEADING_BITS.any(axis=1),
+                           OPPOSITE_DIRECTION[HEADING_BITS.argmax(axis=1)], ACTION_COUNT)
+REVERSE_ACTION_MASK = np.arange(ACTION_COUNT) == REVERSE_ACTIONS[:, None]
+
+
+# 11 个布尔特征最多只有 2048 种状态, 直接用 (2048, 4) 的 Q 表代替神经网络.
+# 观测打包成 uint16 作为状态下标, 所有环境的更新在一次 NumPy 运算中完成,
+# 只依赖 NumPy, 可以在没有 GPU (也没有 torch) 的机器上训练.
+class TabularQLearner:
+
+    def __init__(self, algorithm="q_learning", learning_rate=0.1, gamma=0.95,
+                 exploration_initial_eps=1.0, exploration_final_eps=0.01,
+                 exploration_fraction=0.2, seed=None):
+        assert algorithm in ALGORITHMS
+        self.algorithm = algorithm
+        self.learning_rate = learning_rate
+        self.gamma = gamma
+        self.exploration_initial_eps = exploration_initial_eps
+        self.exploration_final_eps = exploration_final_eps
+        self.exploration_fraction = exploration_fraction
+        self.seed = seed
+
+        self.q_table = np.zeros((STATE_COUNT, ACTION_COUNT), dtype=np.float64)
+        self.num_timesteps = 0
+        self.rng = np.random.default_rng(seed)
+
+    def exploration_rate(self, progress):
+        # progress 从 0 到 1, 前 exploration_fraction 线性下降, 之后保持不变
+        if progress >= self.exploration_fraction:
+            return self.exploration_final_eps
+        return self.exploration_initial_eps + progress / self.exploration_fraction * (
+            self.exploration_final_eps - self.exploration_initial_eps)
+
+    def _masked_q(self, states):
+        return np.where(REVERSE_ACTION_MASK[states], -np.inf, self.q_table[states])
+
+    def _select_actions(self, states, eps):
+        actions = self._masked_q(states).argmax(axis=1)
+        explore = self.rng.random(len(states)) < eps
+        # 在反方向以外的 3 个动作中随机
+        random_actions = self.rng.integers(0, ACTION_COUNT - 1, explore.sum())
+        actions[explore] = random_actions + (random_actions >= REVERSE_ACTIONS[states[explore]])
+        return actions
+
+    def _update(self, states, actions, targets):
+        # 同一批中重复的 (状态, 动作) 取平均, 不会因为很多环境处在同一状态而放大更新
+        cells = states * ACTION_COUNT + actions
+        q_flat = self.q_table.reshape(-1)
+        td_errors = targets - q_flat[cells]
+        sums = np.bincount(cells, weights=td_errors, minlength=q_flat.size)
+        counts = np.bincount(cells, minlength=q_flat.size)
+        updated = counts > 0
+        q_flat[updated] += self.learning_rate * sums[updated] / counts[updated]
+
+    def learn(self, total_timesteps, num_envs=64, world_size=50, max_episode_steps=None,
+              log_interval=100000, verbose=1):
+        if max_episode_steps is None:
+            max_episode_steps = world_size * world_size * 4
+        env = GreedySnakeBatchEnv(num_envs, world_size=world_size,
+                                  max_episode_steps=max_episode_steps)
+        env_seed = None if self.seed is None else self.seed + self.num_timesteps
+        observation, _ = env.reset(seed=env_seed)
+        states = pack_observation(observation).astype(np.int64)
+
+        episode_scores = deque(maxlen=100)
+        eps = self.exploration_rate(0)
+        actions = self._select_actions(states, eps)
+        start = time.perf_counter()
+        start_timesteps = self.num_timesteps
+        next_log = self.num_timesteps + log_interval
+        while self.num_timesteps - start_timesteps < total_timesteps:
+            eps = self.exploration_rate((self.num_timesteps - start_timesteps) / total_timesteps)
+            observation, reward, terminated, truncated, info = env.step(actions)
+            self.num_timesteps += num_envs
+            next_states = pack_observation(observation).astype(np.int64)
+            next_actions = self._select_actions(next_states, eps)
+
+            # 自动重置的环境用结束时的观测计算目标, 真正结束 (terminated) 时不再往后估计
+            bootstrap_states = next_states
+            if "final_observation" in info:
+                bootstrap_states = next_states.copy()
+                done = np.flatnonzero(terminated | truncated)
+                bootstrap_states[done] = pack_observation(
+                    np.stack(info["final_observation"][done]))
+                episode_scores.extend(info["final_info"][index]["score"] for index in done)
+            if self.algorithm == "sarsa":
+                next_values = self.q_table[bootstrap_states, next_actions]
+                if "final_observation" in info:
+                    # 重置后的动作不属于结束的回合, 截断时改用贪心估计
+                    next_values[done] = self._masked_q(bootstrap_states[done]).max(axis=1)
+            else:
+                next_values = self._masked_q(bootstrap_states).max(axis=1)
+            targets = reward + self.gamma * next_values * ~terminated
+            self._update(states, actions, targets)
+
+            states = next_states
+            actions = next_actions
+            if verbose >= 1 and self.num_timesteps >= next_log and episode_scores:
+                next_log += log_interval
+                print("timesteps {:>10} eps {:.3f} mean score {:7.2f} {:>9.0f} steps/s".format(
+                    self.num_timesteps, eps, np.mean(episode_scores),
+                    (self.num_timesteps - start_timesteps) / (time.perf_counter() - start)))
+        env.close()
+        return self
+
+    def predict(self, observation, deterministic=True):
+        # 与 stable-baselines3 的 predict 接口一致, 可以直接用于评估
+        observation = np.asarray(observation)
+        states = pack_observation(observation.reshape(-1, OBSERVATION_SPACE_SIZE)).astype(np.int64)
+        if deterministic:
+            actions = self._masked_q(states).argmax(axis=1)
+        else:
+            actions = self._select_actions(states, self.exploration_final_eps)
+        if observation.ndim == 1:
+            return actions[0], None
+        return actions, None
+
+    def save(self, path):
+        config = {
+            "algorithm": self.algorithm,
+            "learning_rate": self.learning_rate,
+            "gamma": self.gamma,
+            "exploration_initial_eps": self.exploration_initial_eps,
+            "exploration_final_eps": self.exploration_final_eps,
+            "exploration_fraction": self.exploration_fraction,
+            "seed": self.seed,
+        }
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 传入文件对象, 避免 np.savez 自动追加 .npz 后缀
+        with open(path, "wb") as f:
+            np.savez(f, q_table=self.q_table, num_timesteps=self.num_timesteps,
+                     config=json.dumps(config))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            learner = cls(**json.loads(str(data["config"])))
+            learner.q_table[...] = data["q_table"]
+            learner.num_timesteps = int(data["num_timesteps"])
+        return learner
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="q_learning")
+    parser.add_argument("--timesteps", type=float, default=2e6)
+    parser.add_argument("--num-envs", type=int, default=64)
+    parser.add_argument("--world-size", type=int, default=50)
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--gamma", type=float, default=0.95)
+    parser.add_argument("--exploration-fraction", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=TABULAR_MODEL_PATH)
+    parser.add_argument("--resume", action="store_true", help="continue training the table in --output")
+    args = parser.parse_args()
+
+    if args.resume:
+        learner = TabularQLearner.load(args.output)
+    else:
+        learner = TabularQLearner(
+            algorithm=args.algorithm,
+            learning_rate=args.learning_rate,
+            gamma=args.gamma,
+            exploration_fraction=args.exploration_fraction,
+            seed=args.seed,
+        )
+    learner.learn(int(args.timesteps), num_envs=args.num_envs, world_size=args.world_size)
+    learner.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+# stable-baselines3 (以及 torch) 导入很慢, 只有真正用到这些类时才导入,
+# 这样共享内存的子进程导入 gym_greedy_snake.vec_env.shm_worker 时不会加载它们
+def __getattr__(name):
+    if name == "BatchVecEnv":
+        from gym_greedy_snake.vec_env.batch_vec_env import BatchVecEnv
+        return BatchVecEnv
+    if name == "SharedMemoryVecEnv":
+        from gym_greedy_snake.vec_env.shm_vec_env import SharedMemoryVecEnv
+        return SharedMemoryVecEnv
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+__all__ = ["BatchVecEnv", "SharedMemoryVecEnv"]
@@ -0,0 +1,65 @@
+import numpy as np
+
+from stable_baselines3.common.vec_env import VecEnv
+
+try:
+    from stable_baselines3.common.vec_env.patch_gym import _convert_space
+except ImportError:
+    # stable-baselines3 < 2.0 直接使用 gym 的空间
+    def _convert_space(space):
+        return space
+
+
+# 把自动重置的 gym VectorEnv (例如 GreedySnakeBatchEnv) 包装成
+# stable-baselines3 的 VecEnv, 可以直接替换 DummyVecEnv 使用
+class BatchVecEnv(VecEnv):
+
+    def __init__(self, venv):
+        self.venv = venv
+        super().__init__(
+            venv.num_envs,
+            _convert_space(venv.single_observation_space),
+            _convert_space(venv.single_action_space),
+        )
+        self.actions = None
+
+    def reset(self):
+        seeds = self._seeds
+        if all(seed is None for seed in seeds):
+            seeds = None
+        observation, _ = self.venv.reset(seed=seeds)
+        self._reset_seeds()
+        return observation
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        observation, reward, terminated, truncated, info = self.venv.step(
+            self.actions)
+        dones = terminated | truncated
+
+        infos = [{} for _ in range(self.num_envs)]
+        for index in np.flatnonzero(dones):
+            infos[index] = dict(info["final_info"][index])
+            infos[index]["terminal_observation"] = info["final_observation"][index]
+            infos[index]["TimeLimit.truncated"] = bool(
+                truncated[index] and not terminated[index])
+
+        return observation, reward.astype(np.float32), dones, infos
+
+    def close(self):
+        self.venv.close()
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self.venv, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self.venv, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        method = getattr(self.venv, method_name)
+        return [method(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
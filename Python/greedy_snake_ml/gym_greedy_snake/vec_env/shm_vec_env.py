@@ -0,0 +1,141 @@
+import ctypes
+import multiprocessing as mp
+
+import numpy as np
+
+from stable_baselines3.common.vec_env import VecEnv
+
+from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
+from gym_greedy_snake.vec_env.batch_vec_env import _convert_space
+from gym_greedy_snake.vec_env.shm_worker import SHARED_ARRAYS, _shared_views, _worker
+
+# 多进程版本的 VecEnv, 每个进程运行一个包含若干世界的 GreedySnakeBatchEnv.
+# 观测, 奖励和结束标记通过共享内存传递, 管道里只传递很小的命令.
+class SharedMemoryVecEnv(VecEnv):
+
+    def __init__(self, num_envs, workers=None, seed=None, start_method=None, **env_kwargs):
+        if workers is None:
+            workers = mp.cpu_count()
+        workers = max(1, min(workers, num_envs))
+        self.workers = workers
+
+        ctx = mp.get_context(start_method)
+        self.raw_arrays = {
+            name: ctx.RawArray(ctypes.c_uint8, num_envs * int(np.prod(shape, dtype=np.int64))
+                               * np.dtype(dtype).itemsize)
+            for name, (shape, dtype) in SHARED_ARRAYS.items()
+        }
+        self.buffers = _shared_views(self.raw_arrays, num_envs)
+
+        # 尽量平均地把环境分给每个进程
+        bounds = np.linspace(0, num_envs, workers + 1).astype(int)
+        self.worker_slices = [slice(bounds[i], bounds[i + 1]) for i in range(workers)]
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(workers)])
+        self.processes = []
+        for work_remote, remote, worker_slice in zip(self.work_remotes, self.remotes, self.worker_slices):
+            args = (work_remote, remote, self.raw_arrays, num_envs,
+                    worker_slice.start, worker_slice.stop, env_kwargs)
+            # daemon=True: 主进程异常退出时子进程也会退出
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.waiting = False
+        self.closed = False
+        self.root_seed = None
+        self.seed(seed)
+
+        venv = GreedySnakeBatchEnv(1, **env_kwargs)
+        super().__init__(
+            num_envs,
+            _convert_space(venv.single_observation_space),
+            _convert_space(venv.single_action_space),
+        )
+
+    def seed(self, seed=None):
+        # 从同一个根种子为每个进程派生独立的种子
+        self.root_seed = seed
+        if seed is None:
+            self.worker_seeds = [None] * self.workers
+        else:
+            self.worker_seeds = [
+                int(child.generate_state(1)[0])
+                for child in np.random.SeedSequence(seed).spawn(self.workers)
+            ]
+        return self.worker_seeds
+
+    def reset(self):
+        for remote, worker_seed in zip(self.remotes, self.worker_seeds):
+            remote.send(("reset", worker_seed))
+        for remote in self.remotes:
+            remote.recv()
+        # 种子只使用一次
+        self.worker_seeds = [None] * self.workers
+        return self.buffers["observations"].copy()
+
+    def step_async(self, actions):
+        self.buffers["actions"][:] = actions
+        for remote in self.remotes:
+            remote.send(("step", None))
+        self.waiting = True
+
+    def step_wait(self):
+        for remote in self.remotes:
+            remote.recv()
+        self.waiting = False
+
+        dones = self.buffers["dones"].copy()
+        infos = [{} for _ in range(self.num_envs)]
+        for index in np.flatnonzero(dones):
+            infos[index] = {
+                "score": int(self.buffers["scores"][index]),
+                "length": int(self.buffers["lengths"][index]),
+                "frame_index": int(self.buffers["frame_indices"][index]),
+                "terminal_observation": self.buffers["terminal_observations"][index].copy(),
+                "TimeLimit.truncated": bool(self.buffers["truncateds"][index]),
+            }
+        return (self.buffers["observations"].copy(), self.buffers["rewards"].copy(),
+                dones, infos)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def _get_target_remotes(self, indices):
+        # 每个环境下标对应负责它的进程
+        return [self.remotes[np.searchsorted([s.stop for s in self.worker_slices], i, side="right")]
+                for i in self._get_indices(indices)]
+
+    def get_attr(self, attr_name, indices=None):
+        if attr_name == "render_mode":
+            return [None for _ in self._get_indices(indices)]
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("get_attr", attr_name))
+        return [remote.recv() for remote in target_remotes]
+
+    def set_attr(self, attr_name, value, indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("set_attr", (attr_name, value)))
+        for remote in target_remotes:
+            remote.recv()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in target_remotes]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
@@ -0,0 +1,81 @@
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_batch import GreedySnakeBatchEnv
+from gym_greedy_snake.envs.greedy_snake_world import OBSERVATION_SPACE_SIZE
+
+# 子进程只导入这个模块, 不需要加载 stable-baselines3 和 torch
+
+# 共享内存中的数组: 名字 -> (每个环境的形状, 类型)
+SHARED_ARRAYS = {
+    "observations": ((OBSERVATION_SPACE_SIZE,), np.bool_),
+    "terminal_observations": ((OBSERVATION_SPACE_SIZE,), np.bool_),
+    "rewards": ((), np.float32),
+    "dones": ((), np.bool_),
+    "truncateds": ((), np.bool_),
+    "actions": ((), np.int64),
+    "scores": ((), np.int64),
+    "lengths": ((), np.int64),
+    "frame_indices": ((), np.int64),
+}
+
+
+def _shared_views(raw_arrays, num_envs):
+    return {
+        name: np.frombuffer(raw_arrays[name], dtype=dtype).reshape((num_envs,) + shape)
+        for name, (shape, dtype) in SHARED_ARRAYS.items()
+    }
+
+
+def _worker(remote, parent_remote, raw_arrays, num_envs, start, stop, env_kwargs):
+    parent_remote.close()
+    buffers = _shared_views(raw_arrays, num_envs)
+    observations = buffers["observations"][start:stop]
+    terminal_observations = buffers["terminal_observations"][start:stop]
+    rewards = buffers["rewards"][start:stop]
+    dones = buffers["dones"][start:stop]
+    truncateds = buffers["truncateds"][start:stop]
+    actions = buffers["actions"][start:stop]
+    scores = buffers["scores"][start:stop]
+    lengths = buffers["lengths"][start:stop]
+    frame_indices = buffers["frame_indices"][start:stop]
+
+    env = GreedySnakeBatchEnv(stop - start, **env_kwargs)
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                observation, reward, terminated, truncated, info = env.step(
+                    actions)
+                observations[:] = observation
+                rewards[:] = reward
+                dones[:] = terminated | truncated
+                truncateds[:] = truncated & ~terminated
+                if "final_observation" in info:
+                    for index in np.flatnonzero(dones):
+                        terminal_observations[index] = info["final_observation"][index]
+                        final_info = info["final_info"][index]
+                        scores[index] = final_info["score"]
+                        lengths[index] = final_info["length"]
+                        frame_indices[index] = final_info["frame_index"]
+                remote.send(None)
+            elif cmd == "reset":
+                observation, _ = env.reset(seed=data)
+                observations[:] = observation
+                remote.send(None)
+            elif cmd == "get_attr":
+                remote.send(getattr(env, data))
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "env_method":
+                method_name, args, kwargs = data
+                remote.send(getattr(env, method_name)(*args, **kwargs))
+            elif cmd == "close":
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(
+                    "`{}` is not implemented in the worker".format(cmd))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
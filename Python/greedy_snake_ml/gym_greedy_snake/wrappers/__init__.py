@@ -2,3 +2,7 @@ from gym_examples.wrappers.clip_reward import ClipReward
 from gym_examples.wrappers.discrete_actions import DiscreteActions
 from gym_examples.wrappers.reacher_weighted_reward import ReacherRewardWrapper
 from gym_examples.wrappers.relative_position import RelativePosition
+from gym_greedy_snake.wrappers.phase_profile import PhaseProfile
+from gym_greedy_snake.wrappers.episode_recorder import EpisodeRecorder, EpisodeReplayer
+from gym_greedy_snake.wrappers.frame_stack import FrameStack, BatchFrameStack
+from gym_greedy_snake.wrappers.video_recorder import VideoRecorder, load_frames
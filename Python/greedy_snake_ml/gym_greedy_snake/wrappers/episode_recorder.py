@@ -0,0 +1,171 @@
+import json
+import os
+import struct
+
+import gym
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_world import GreedySnakeWorldEnv
+
+# 录像文件格式:
+#   文件头: MAGIC, 版本(uint16), 配置长度(uint32), 配置 JSON
+#   每个回合: 种子(uint64), 步数(uint32), 打包后的动作(每字节 4 个动作, 每个 2 位)
+# 旁边的 .idx 文件按回合保存 (offset, seed, steps), 可以直接跳到任意回合,
+# 丢失时可以扫描录像文件重新生成.
+MAGIC = b"GSEP"
+VERSION = 1
+HEADER_FORMAT = "<4sHI"
+RECORD_FORMAT = "<QI"
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("seed", "<u8"), ("steps", "<u4")])
+DYNAMICS_CONFIG = ["world_size", "start_pool_size", "start_pool_seed", "sparse"]
+
+ACTION_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+def pack_actions(actions):
+    actions = np.asarray(actions, dtype=np.uint8)
+    padded = np.zeros((len(actions) + 3) // 4 * 4, dtype=np.uint8)
+    padded[:len(actions)] = actions
+    return np.bitwise_or.reduce(padded.reshape(-1, 4) << ACTION_SHIFTS, axis=1).astype(np.uint8)
+
+
+def unpack_actions(packed, steps):
+    packed = np.asarray(packed, dtype=np.uint8)
+    return ((packed[:, None] >> ACTION_SHIFTS) & 3).reshape(-1)[:steps]
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class EpisodeRecorder(gym.Wrapper):
+    def __init__(self, env, path, seed=None):
+        super().__init__(env)
+        self.path = path
+        # 所有影响环境动态的参数, 重放时用相同的参数创建环境
+        self.config = {name: getattr(env.unwrapped, name) for name in DYNAMICS_CONFIG}
+        # 没有指定种子的 reset 用这个随机数生成器产生种子, 保证每个回合都能重放
+        self.seed_rng = np.random.default_rng(seed)
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                config = _read_header(f)
+            if config != self.config:
+                raise ValueError(
+                    "{} was recorded with {}, not {}".format(path, config, self.config))
+            self.file = open(path, "ab")
+            self.index_file = open(index_path(path), "ab")
+        else:
+            self.file = open(path, "wb")
+            config = json.dumps(self.config).encode()
+            self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(config)))
+            self.file.write(config)
+            # 之前录像留下的索引指向的是旧文件中的位置
+            self.index_file = open(index_path(path), "wb")
+
+        self.episode_seed = None
+        self.actions = []
+
+    def reset(self, seed=None, options=None):
+        self._write_episode()
+        if seed is None:
+            seed = int(self.seed_rng.integers(0, 2 ** 63))
+        self.episode_seed = seed
+        return self.env.reset(seed=seed, options=options)
+
+    def step(self, action):
+        self.actions.append(int(action))
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        if terminated or truncated:
+            self._write_episode()
+        return obs, reward, terminated, truncated, info
+
+    def _write_episode(self):
+        if self.episode_seed is None or len(self.actions) == 0:
+            return
+        self.file.write(struct.pack(RECORD_FORMAT, self.episode_seed, len(self.actions)))
+        offset = self.file.tell()
+        self.file.write(pack_actions(self.actions).tobytes())
+        entry = np.array([(offset, self.episode_seed, len(self.actions))], dtype=INDEX_DTYPE)
+        self.index_file.write(entry.tobytes())
+        self.episode_seed = None
+        self.actions = []
+
+    def close(self):
+        if not self.file.closed:
+            self._write_episode()
+            self.file.close()
+            self.index_file.close()
+        return super().close()
+
+
+def _read_header(f):
+    magic, version, config_length = struct.unpack(
+        HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT)))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not an episode recording".format(f.name))
+    return json.loads(f.read(config_length))
+
+
+class EpisodeReplayer:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.config = _read_header(f)
+            self.data_offset = f.tell()
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+
+        if os.path.exists(index_path(path)) and os.path.getsize(index_path(path)) > 0:
+            self.index = np.memmap(index_path(path), dtype=INDEX_DTYPE, mode="r")
+        else:
+            self.index = self._scan_index()
+
+    def _scan_index(self):
+        entries = []
+        offset = self.data_offset
+        record_size = struct.calcsize(RECORD_FORMAT)
+        while offset + record_size <= len(self.data):
+            seed, steps = struct.unpack_from(RECORD_FORMAT, self.data, offset)
+            offset += record_size
+            entries.append((offset, seed, steps))
+            offset += (steps + 3) // 4
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    def episode(self, index):
+        entry = self.index[index]
+        offset, steps = int(entry["offset"]), int(entry["steps"])
+        packed = self.data[offset:offset + (steps + 3) // 4]
+        return int(entry["seed"]), unpack_actions(packed, steps)
+
+    def make_env(self, **kwargs):
+        return GreedySnakeWorldEnv(**self.config, **kwargs)
+
+    def replay(self, index, env=None):
+        # 依次产生 (step, observation, reward, terminated), step 0 为 reset 之后
+        seed, actions = self.episode(index)
+        if env is None:
+            env = self.make_env(info_level="none")
+        observation, _ = env.reset(seed=seed)
+        yield 0, observation, 0, False
+        for step, action in enumerate(actions, 1):
+            observation, reward, terminated, _, _ = env.step(action)
+            yield step, observation, reward, terminated
+
+    def env_at(self, index, step, env=None):
+        # 返回停在第 index 个回合第 step 步的环境
+        if env is None:
+            env = self.make_env(info_level="none")
+        for current_step, _, _, _ in self.replay(index, env):
+            if current_step == step:
+                return env
+        raise IndexError("episode {} has fewer than {} steps".format(index, step))
+
+    def frame(self, index, step):
+        env = self.env_at(index, step, self.make_env(
+            render_mode="rgb_array", info_level="none"))
+        frame = env.render()
+        env.close()
+        return frame
@@ -0,0 +1,109 @@
+import gym
+from gym import spaces
+from gym.vector import VectorEnvWrapper
+import numpy as np
+
+
+def _stack_space(space, num_stack):
+    return spaces.Box(
+        np.repeat(space.low[None], num_stack, axis=0),
+        np.repeat(space.high[None], num_stack, axis=0),
+        dtype=space.dtype,
+    )
+
+
+# 保存最近 num_stack 帧的环形缓冲区, 形状为 (num_envs, capacity, *帧形状).
+# 新的帧依次写在 end 处, 返回的叠帧是 buffer[:, end - num_stack:end] 的视图, 每一步
+# 只写入一帧, 不拼接也不复制. 写到 capacity 末尾或者有环境重置时, 把每个环境最近的
+# num_stack - 1 帧搬到一段新的位置 (重置的环境用第一帧填满), 这段位置与当前的叠帧不重叠,
+# 所以上一步返回的视图在下一步之后仍然有效 (例如 stable-baselines3 保存的上一个观测).
+class FrameRing:
+
+    def __init__(self, num_envs, num_stack, frame_shape, dtype, capacity=None):
+        if capacity is None:
+            capacity = num_stack * 4
+        assert capacity >= num_stack * 3, "capacity must be at least 3 * num_stack"
+        self.num_stack = num_stack
+        self.capacity = capacity
+        self.buffer = np.zeros((num_envs, capacity) + tuple(frame_shape), dtype=dtype)
+        self.end = 0
+        self.all_envs = np.ones(num_envs, dtype=np.bool_)
+
+    def stacks(self):
+        return self.buffer[:, self.end - self.num_stack:self.end]
+
+    def append(self, frames, reset=None):
+        # frames: (num_envs, *帧形状); reset 为 True 的环境开始新的回合
+        if reset is None or not reset.any():
+            if self.end < self.capacity:
+                self.buffer[:, self.end] = frames
+                self.end += 1
+                return self.stacks()
+            reset = None
+        self._rebase(frames, reset)
+        return self.stacks()
+
+    def _rebase(self, frames, reset):
+        num_stack = self.num_stack
+        start = self.end if self.end + num_stack <= self.capacity else 0
+        history = slice(start, start + num_stack - 1)
+        if reset is None:
+            self.buffer[:, history] = self.buffer[:, self.end - num_stack + 1:self.end]
+        else:
+            keep = ~reset
+            if keep.any():
+                self.buffer[keep, history] = self.buffer[keep, self.end - num_stack + 1:self.end]
+            self.buffer[reset, history] = frames[reset][:, None]
+        self.buffer[:, start + num_stack - 1] = frames
+        self.end = start + num_stack
+
+
+# 单个环境的叠帧, 观测为 (num_stack, *原观测形状).
+# 返回的是环形缓冲区的视图, 需要长期保存时请复制
+class FrameStack(gym.Wrapper):
+
+    def __init__(self, env, num_stack=4, capacity=None):
+        super().__init__(env)
+        self.num_stack = num_stack
+        self.observation_space = _stack_space(env.observation_space, num_stack)
+        self.ring = FrameRing(1, num_stack, env.observation_space.shape,
+                              env.observation_space.dtype, capacity)
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        return self.ring.append(observation[None], self.ring.all_envs)[0], info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        return self.ring.append(observation[None])[0], reward, terminated, truncated, info
+
+
+# 自动重置的批量环境 (例如 GreedySnakeBatchEnv) 的叠帧, 观测为 (num_envs, num_stack, ...).
+# 结束的环境在 info["final_observation"] 中得到结束时完整的叠帧 (只复制这些环境)
+class BatchFrameStack(VectorEnvWrapper):
+
+    def __init__(self, env, num_stack=4, capacity=None):
+        super().__init__(env)
+        self.num_stack = num_stack
+        self.single_observation_space = _stack_space(env.single_observation_space, num_stack)
+        self.observation_space = gym.vector.utils.batch_space(
+            self.single_observation_space, env.num_envs)
+        self.ring = FrameRing(env.num_envs, num_stack, env.single_observation_space.shape,
+                              env.single_observation_space.dtype, capacity)
+
+    def reset_wait(self, **kwargs):
+        observation, info = self.env.reset_wait(**kwargs)
+        return self.ring.append(observation, self.ring.all_envs), info
+
+    def step_wait(self):
+        observation, reward, terminated, truncated, info = self.env.step_wait()
+        dones = terminated | truncated
+        if dones.any() and "final_observation" in info:
+            info = dict(info)
+            final_observation = info["final_observation"].copy()
+            stacks = self.ring.stacks()
+            for index in np.flatnonzero(dones):
+                final_observation[index] = np.concatenate(
+                    [stacks[index, 1:], final_observation[index][None]])
+            info["final_observation"] = final_observation
+        return self.ring.append(observation, dones), reward, terminated, truncated, info
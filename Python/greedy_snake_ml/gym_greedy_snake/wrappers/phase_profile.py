@@ -0,0 +1,23 @@
+import gym
+
+
+class PhaseProfile(gym.Wrapper):
+    def __init__(self, env):
+        super().__init__(env)
+        self.env.unwrapped.enable_profiling()
+
+    @property
+    def profile(self):
+        return self.env.unwrapped.get_profile()
+
+    def reset(self, **kwargs):
+        # 每个回合重新统计
+        self.env.unwrapped.reset_profile()
+        return self.env.reset(**kwargs)
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        if terminated or truncated:
+            info = dict(info)
+            info["phase_profile"] = self.profile
+        return obs, reward, terminated, truncated, info
@@ -0,0 +1,194 @@
+import os
+import queue
+import threading
+import zipfile
+
+import gym
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_world import GRID_COLORS, GRID_SIZE, GreedySnakeWorldEnv
+
+# 用法:
+#   env = VideoRecorder(GreedySnakeWorldEnv(), "./videos/", record_every=100)
+#   frames = load_frames("./videos/episode_000000.npz")
+
+QUEUE_POLICIES = ["drop", "block"]
+# world: 每帧只复制世界格子 (S x S 个 uint8), 由后台线程或读取时再转换成图像;
+# render: 调用 env.render() 得到 rgb_array 图像, 用于其它环境
+CAPTURE_MODES = ["world", "render"]
+# 存档中每个条目最多包含的帧数, 减少逐帧写 zip 条目的开销
+ARCHIVE_CHUNK_FRAMES = 64
+# 队列中的控制消息: (START, 路径) 开始一个回合, END 结束当前回合, STOP 停止后台线程
+START = "start"
+END = "end"
+STOP = "stop"
+
+
+def render_world(world):
+    # 与 rgb_array 渲染的格子区域相同 (不含顶部文字), world 按 [x, y] 存储, 图像按 [y, x]
+    image = GRID_COLORS[world.T]
+    return np.repeat(np.repeat(image, GRID_SIZE, axis=0), GRID_SIZE, axis=1)
+
+
+# 压缩帧存档: 边录边把每 ARCHIVE_CHUNK_FRAMES 帧作为 frames_<序号>.npy 写入 deflate
+# 压缩的 zip, 内存中不保留整个回合. np.load 可以直接读取, 帧可以是世界格子或者图像
+class NpzFrameWriter:
+
+    def __init__(self, path, fps):
+        self.archive = zipfile.ZipFile(
+            path, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        self.frames = []
+        self.chunk_count = 0
+
+    def append(self, frame):
+        self.frames.append(frame)
+        if len(self.frames) >= ARCHIVE_CHUNK_FRAMES:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        name = "frames_{:06d}.npy".format(self.chunk_count)
+        with self.archive.open(name, mode="w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.stack(self.frames), allow_pickle=False)
+        self.frames = []
+        self.chunk_count += 1
+
+    def close(self):
+        if self.frames:
+            self._write_chunk()
+        self.archive.close()
+
+
+# mp4/gif 等视频格式交给 imageio (需要另外安装 imageio, mp4 还需要 imageio-ffmpeg)
+class ImageioFrameWriter:
+
+    def __init__(self, path, fps):
+        import imageio
+        self.writer = imageio.get_writer(path, fps=fps)
+
+    def append(self, frame):
+        if frame.ndim == 2:
+            frame = render_world(frame)
+        self.writer.append_data(frame)
+
+    def close(self):
+        self.writer.close()
+
+
+def load_frames(path, render=True):
+    # 返回 (帧数, 高, 宽, 3) 的图像; 录制的是世界格子且 render=False 时返回 (帧数, S, S)
+    with np.load(path) as archive:
+        frames = np.concatenate([archive[name] for name in sorted(archive.files)])
+    if frames.ndim == 3 and render:
+        frames = np.stack([render_world(frame) for frame in frames])
+    return frames
+
+
+# 每 record_every 个回合录制一个, 帧放进容量为 queue_size 的队列, 由后台线程编码写入
+# video_dir/episode_<回合序号>.<format>. 队列满时 policy="drop" 丢弃这一帧 (计入
+# dropped_frames), policy="block" 等待后台线程. 不录制的回合没有任何额外开销.
+class VideoRecorder(gym.Wrapper):
+
+    def __init__(self, env, video_dir, record_every=1, format="npz", queue_size=256,
+                 policy="drop", fps=None, capture=None):
+        super().__init__(env)
+        if capture is None:
+            unwrapped = env.unwrapped
+            dense_world = isinstance(unwrapped, GreedySnakeWorldEnv) and not unwrapped.sparse
+            capture = "world" if dense_world else "render"
+        assert capture in CAPTURE_MODES
+        assert capture == "world" or env.render_mode == "rgb_array", \
+            "capture=\"render\" needs render_mode=\"rgb_array\""
+        assert policy in QUEUE_POLICIES
+        self.capture = capture
+        self.video_dir = video_dir
+        self.record_every = record_every
+        self.format = format
+        self.policy = policy
+        self.fps = env.metadata.get("render_fps", 4) if fps is None else fps
+        self.writer_class = NpzFrameWriter if format == "npz" else ImageioFrameWriter
+        os.makedirs(video_dir, exist_ok=True)
+
+        self.episode_index = -1
+        self.recording = False
+        self.recorded_episodes = 0
+        self.dropped_frames = 0
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def _write_loop(self):
+        writer = None
+        while True:
+            item = self.queue.get()
+            try:
+                if isinstance(item, np.ndarray):
+                    if writer is not None:
+                        writer.append(item)
+                elif item[0] == START:
+                    writer = self.writer_class(item[1], self.fps)
+                elif item[0] in (END, STOP):
+                    if writer is not None:
+                        writer.close()
+                        writer = None
+                    if item[0] == STOP:
+                        return
+            except Exception as error:
+                # 出错的回合不再写入, 异常在调用线程的下一次 reset 或 close 时抛出
+                self.error = error
+                writer = None
+
+    def _check_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _push_frame(self):
+        if self.capture == "world":
+            frame = self.env.unwrapped.world.copy()
+        else:
+            frame = self.env.render()
+        if self.policy == "block":
+            self.queue.put(frame)
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def _end_episode(self):
+        if self.recording:
+            # 控制消息总是等待放入, 不会被丢弃
+            self.queue.put((END,))
+            self.recording = False
+            self.recorded_episodes += 1
+
+    def reset(self, **kwargs):
+        self._check_error()
+        self._end_episode()
+        observation, info = self.env.reset(**kwargs)
+        self.episode_index += 1
+        if self.episode_index % self.record_every == 0:
+            path = os.path.join(self.video_dir, "episode_{:06d}.{}".format(
+                self.episode_index, self.format))
+            self.queue.put((START, path))
+            self.recording = True
+            self._push_frame()
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        if self.recording:
+            self._push_frame()
+            if terminated or truncated:
+                self._end_episode()
+        return observation, reward, terminated, truncated, info
+
+    def close(self):
+        if self.thread.is_alive():
+            self._end_episode()
+            self.queue.put((STOP,))
+            self.thread.join()
+        self._check_error()
+        return super().close()
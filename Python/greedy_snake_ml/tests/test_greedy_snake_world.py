@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from gym_greedy_snake.envs.greedy_snake_world import GreedySnakeWorldEnv, UP
+
+
+def test_info_world_survives_autoreset():
+    # 撞墙的一步不移动蛇, 结束时的 world 应该与这一步之前相同, 而不是重置后的世界
+    env = DummyVecEnv([lambda: GreedySnakeWorldEnv(world_size=12)])
+    env.seed(0)
+    env.reset()
+    world = env.envs[0].unwrapped.world
+    while True:
+        before = world.copy()
+        _, _, dones, infos = env.step(np.array([UP]))
+        if dones[0]:
+            break
+    assert (infos[0]["world"] == before).all()
+    assert not (infos[0]["world"] == world).all()
+    env.close()
+
+
+def test_lazy_info_mutation():
+    env = GreedySnakeWorldEnv(world_size=12)
+    _, info = env.reset(seed=0)
+    world = env.world.copy()
+
+    assert "snake" in info
+    snake = info.pop("snake")
+    assert snake.shape == (4, 2)
+    assert "snake" not in info
+
+    assert (info.setdefault("world", None) == world).all()
+    _, info = env.reset(seed=0)
+    info.update(world=1)
+    assert info["world"] == 1 and dict(info)["world"] == 1
+    # 还没有构建的字段已经存在, setdefault 返回它而不是默认值
+    assert info.setdefault("snake", 2).shape == (4, 2)
+    assert info.copy()["snake"].shape == (4, 2)
+
+    _, info = env.reset(seed=0)
+    del info["world"]
+    assert "world" not in info and "world" not in info.keys()
+    info["snake"] = 3
+    assert dict(info)["snake"] == 3
+    with pytest.raises(KeyError):
+        info.pop("world")
+    assert info.pop("world", None) is None
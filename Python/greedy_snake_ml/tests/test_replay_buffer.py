@@ -0,0 +1,30 @@
+import numpy as np
+from stable_baselines3 import DQN
+
+from gym_greedy_snake.envs import GreedySnakeBatchEnv
+from gym_greedy_snake.training.expert import prefill_replay_buffer
+from gym_greedy_snake.training.replay_buffer import (
+    PackedReplayBuffer, TruncateLastTrajectoryCallback,
+)
+from gym_greedy_snake.vec_env import BatchVecEnv
+
+
+def _next_observation(replay_buffer, index):
+    samples = replay_buffer._get_samples(np.array([index]))
+    return samples.next_observations.numpy()[0]
+
+
+def test_prefill_then_learn_keeps_last_next_observation(tmp_path):
+    env = BatchVecEnv(GreedySnakeBatchEnv(1, world_size=12))
+    env.seed(0)
+    model = DQN("MlpPolicy", env, buffer_size=1000, learning_starts=1000, device="cpu",
+                replay_buffer_class=PackedReplayBuffer,
+                replay_buffer_kwargs={"path": str(tmp_path / "replay")})
+    prefill_replay_buffer(model, 50, world_size=12, seed=1)
+    replay_buffer = model.replay_buffer
+    last = replay_buffer.pos - 1
+    expected = _next_observation(replay_buffer, last)
+
+    model.learn(20, callback=TruncateLastTrajectoryCallback())
+    assert (_next_observation(replay_buffer, last) == expected).all()
+    env.close()
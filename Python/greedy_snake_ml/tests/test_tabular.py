@@ -0,0 +1,22 @@
+import numpy as np
+
+from gym_greedy_snake.envs.greedy_snake_world import OPPOSITE_DIRECTION, unpack_observation
+from gym_greedy_snake.training.tabular import STATE_COUNT, TabularQLearner
+
+
+def test_trained_table_never_selects_reverse_action():
+    learner = TabularQLearner(seed=0).learn(20000, num_envs=16, world_size=12, verbose=0)
+    observations = unpack_observation(np.arange(STATE_COUNT))
+    headings = observations[:, 3:7]
+    valid = headings.sum(axis=1) == 1
+    reverse = OPPOSITE_DIRECTION[headings.argmax(axis=1)]
+
+    actions, _ = learner.predict(observations)
+    assert (actions[valid] != reverse[valid]).all()
+
+    # 反方向的 Q 值最大时也不能选中它
+    learner.q_table[np.arange(STATE_COUNT), reverse] = 1e9
+    actions, _ = learner.predict(observations)
+    assert (actions[valid] != reverse[valid]).all()
+    actions, _ = learner.predict(observations, deterministic=False)
+    assert (actions[valid] != reverse[valid]).all()